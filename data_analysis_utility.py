@@ -0,0 +1,145 @@
+# -*- coding: UTF-8 -*-
+import logging
+import numpy as np
+import pandas as pd
+from data_visualization_utility import ErrorCode, VisualizeParameters, DataVisualization, DataVisualize
+
+
+#
+# results of one analysis, one row/value per channel, arrays are None if the sensor has no such result
+#
+class AnalysisResult:
+    def __init__(self):
+        self.sensor = None
+        self.channels = list()
+        self.bad_channels = list()
+        self.sample_rate = 1
+        self.freq_convert_type = "fft"
+        self.fft_size = None  # (channels,) fft length
+        self.decimation = None  # (channels,) emg decimation factor of the signals of the fft, 1: not decimated
+        self.spectrum_rate = None  # (channels,) emg sample rate of the signals of the fft
+        # spectra
+        self.freq = None  # (bins,) frequency axis shared by all channels
+        self.spectrum = None  # (channels, bins) dBV of fft, dB/Hz of psd, amplitude of other sensors
+        self.peak_freq = None  # (channels,)
+        self.peak_amp = None  # (channels,)
+        self.harmonics = None  # (harmonics,) orders of the harmonics
+        self.harmonic_freq = None  # (harmonics, channels)
+        self.harmonic_amp = None  # (harmonics, channels)
+        self.zoom_freq = None  # (1 + harmonics, channels) sub-bin peak and harmonics, only with peak_zoom
+        self.zoom_amp = None  # (1 + harmonics, channels)
+        # time domain
+        self.time = None  # (samples,)
+        self.signal = None  # (channels, samples) signals without dc bias, filtered
+        self.rms = None  # (channels,) emg
+        self.psd_rms = None  # (channels,) emg psd
+        self.avg_p2p = None  # (channels,) emg average peak to peak of the cycles
+        self.cycle_time = None  # (channels,) emg
+        self.bias = None  # (channels,) emg dc bias, average of other sensors
+        self.noise = None  # (channels,) other sensors
+        self.snr = None  # (channels,) ppg
+
+    # scalar results of each channel, one row per channel
+    def statistics(self) -> pd.DataFrame:
+        _columns = {"Signal": self.channels}
+        for name, val in [["Peak.freq", self.peak_freq], ["Peak.amp", self.peak_amp], ["RMS", self.rms],
+                          ["PSD RMS", self.psd_rms], ["Avg. Peak-to-Peak", self.avg_p2p], ["Cycle time", self.cycle_time],
+                          ["Bias", self.bias], ["Noise", self.noise], ["SNR", self.snr], ["FFT size", self.fft_size],
+                          ["Decimation", self.decimation], ["Spectrum rate", self.spectrum_rate]]:
+            if val is not None and len(val) == len(self.channels):
+                _columns[name] = val
+        if self.harmonic_freq is not None:
+            for k, h in enumerate(self.harmonics):
+                _columns[f"H{h}.freq"] = self.harmonic_freq[k]
+                _columns[f"H{h}.amp"] = self.harmonic_amp[k]
+        if self.zoom_freq is not None:
+            for k, name in enumerate(["Peak"] + [f"H{h}" for h in self.harmonics]):
+                _columns[f"{name}.zoom.freq"] = self.zoom_freq[k]
+                _columns[f"{name}.zoom.amp"] = self.zoom_amp[k]
+        return pd.DataFrame(_columns)
+
+
+'''
+    rows of one key of target_data in one array, None if the key is not in target_data or the rows have different
+    lengths
+'''
+def stack_rows(target_data: dict, key: str, dtype=None):
+    if key not in target_data or not len(target_data[key]):
+        return None
+    if len(set([np.shape(val) for val in target_data[key]])) != 1:
+        return None
+    return np.asarray(target_data[key], dtype=dtype)
+
+
+'''
+    calculate the results of params without matplotlib drawing, tables, check buttons or files,
+    kwargs are passed to DataVisualize, e.g. logger, result_cache, stage_cache
+    return: (ErrorCode, AnalysisResult)
+'''
+def analyze(params: VisualizeParameters, **kwargs) -> (ErrorCode, AnalysisResult):
+    logger = kwargs["logger"] if 'logger' in kwargs and kwargs["logger"] is not None else logging.getLogger()
+    try:
+        if params.data_type is not None and params.data_type.lower() == "summary data":
+            logger.error("summary data has no analysis")
+            return ErrorCode.ERR_BAD_ARGS, None
+        dv = DataVisualize(params, **kwargs)
+        if not isinstance(dv, DataVisualization):
+            return ErrorCode.ERR_BAD_ARGS, None
+        _err_code, _data = dv.analyze_data(params)
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, None
+
+        result = AnalysisResult()
+        result.sensor = params.sensor
+        result.channels = list(dv.target_channels)
+        result.bad_channels = list(dv.bad_channel)
+        result.sample_rate = params.sample_rate
+        result.freq_convert_type = params.freq_convert_type
+        result.fft_size = stack_rows(_data, "fft_size", np.int64)
+        result.decimation = stack_rows(_data, "decimation", np.int64)
+        result.spectrum_rate = stack_rows(_data, "spectrum_rate", np.float64)
+        if len(result.channels):
+            result.freq = np.asarray(_data["target_freq"][0])
+            result.time = np.asarray(_data["time"][0])
+        result.spectrum = stack_rows(_data, "target_sig")
+        result.peak_freq = stack_rows(_data, "target_freq_peak", np.float64)
+        result.peak_amp = stack_rows(_data, "target_sig_peak", np.float64)
+        result.signal = stack_rows(_data, "sig")
+        if params.sensor.lower() == "emg":
+            result.harmonics = np.asarray(params.harmonics)
+            if dv.harmonic_data is not None and len(result.channels):
+                result.harmonic_freq = np.array([[val for val, _ in row] for row in dv.harmonic_data],
+                                                dtype=np.float64).reshape(len(result.harmonics), -1)
+                result.harmonic_amp = np.array([[val for _, val in row] for row in dv.harmonic_data],
+                                               dtype=np.float64).reshape(len(result.harmonics), -1)
+            if dv.zoom_data is not None:
+                result.zoom_freq = np.array([[val for val, _ in row] for row in dv.zoom_data], dtype=np.float64)
+                result.zoom_amp = np.array([[val for _, val in row] for row in dv.zoom_data], dtype=np.float64)
+            result.rms = stack_rows(_data, "total_rms", np.float64)
+            if params.freq_convert_type == "psd":
+                result.psd_rms = stack_rows(_data, "target_rms", np.float64)
+            result.avg_p2p = stack_rows(_data, "avg_p2p", np.float64)
+            result.cycle_time = stack_rows(_data, "cycle_time", np.float64)
+            result.bias = stack_rows(_data, "bias", np.float64)
+        else:
+            result.bias = stack_rows(_data, "avg", np.float64)
+            result.noise = stack_rows(_data, "noise", np.float64)
+            result.snr = stack_rows(_data, "snr", np.float64)
+        return ErrorCode.ERR_NO_ERROR, result
+    except Exception as ex:
+        logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+        return ErrorCode.ERR_BAD_UNKNOWN, None
+
+
+if __name__ == '__main__':
+    import sys
+    from my_logger import *
+
+    param = VisualizeParameters()
+    param.data_file = sys.argv[1]
+    param.sensor = sys.argv[2].lower() if len(sys.argv) > 2 else "emg"
+    param.data_type = "Raw Data"
+    param.sample_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 1
+    logger = MyLogger(level='info', save=False)
+    err, res = analyze(param, logger=logger)
+    print(err, res.statistics().to_string() if res is not None else None)
@@ -0,0 +1,332 @@
+# -*- coding: UTF-8 -*-
+import os
+import hashlib
+import collections
+import logging
+import pickle
+import json
+import time
+import io
+import zipfile
+import numpy as np
+
+DEFAULT_CACHE_SIZE = 1 << 30  # max bytes of all cached files
+CACHE_FILE_EXT = ".pkl"
+ARRAY_FILE_EXT = ".npz"  # files of ArrayCache
+CACHE_INDEX_FILE = "index.json"  # non-array values of all ArrayCache entries
+CACHE_COMPRESS_LEVEL = 1  # zlib level of ArrayCache arrays, decompression takes about the same time at any level
+CACHE_TEMP_EXT = ".tmp"
+CACHE_TEMP_AGE = 600  # seconds, older temp files are left by a crash and removed
+DIGEST_BLOCK_SIZE = 1 << 20
+STAGE_CACHE_ENTRIES = 1  # latest outputs kept for each pipeline stage, outputs can be as large as the signals
+FILE_DIGEST_ENTRIES = 4096  # latest file digests kept in memory
+
+# content digest of files, keyed by (path, size, mtime), so an unchanged file is only hashed once,
+# least recently used ones are dropped when there are more than FILE_DIGEST_ENTRIES
+file_digests = collections.OrderedDict()
+
+
+'''
+    digest of the file content, files with the same content have the same digest wherever they are
+    _file: full file path
+    _quick: use size and mtime instead of the content, no file reading
+'''
+def file_digest(_file: str, _quick: bool = False) -> str:
+    _stat = os.stat(_file)
+    if _quick:
+        return f"{os.path.abspath(_file)}:{_stat.st_size}:{_stat.st_mtime_ns}"
+    _key = (os.path.abspath(_file), _stat.st_size, _stat.st_mtime_ns)
+    if _key not in file_digests:
+        _hash = hashlib.blake2b(digest_size=16)
+        with open(_file, 'rb') as _fh:
+            while True:
+                _block = _fh.read(DIGEST_BLOCK_SIZE)
+                if not _block:
+                    break
+                _hash.update(_block)
+        file_digests[_key] = _hash.hexdigest()
+        while len(file_digests) > FILE_DIGEST_ENTRIES:
+            file_digests.popitem(last=False)
+    file_digests.move_to_end(_key)
+    return file_digests[_key]
+
+
+#
+# key-value cache on disk, each value is pickled into one file in the cache folder,
+# least recently used files are removed when total size is over max_size
+#
+class DataCache:
+    def __init__(self, **kwargs):
+        self.logger = kwargs["logger"] if 'logger' in kwargs and kwargs['logger'] is not None else logging.getLogger()
+        self.path = kwargs["path"] if 'path' in kwargs else os.path.join(os.path.abspath("."), "cache")
+        self.max_size = kwargs["max_size"] if 'max_size' in kwargs else DEFAULT_CACHE_SIZE
+        self.enable = kwargs["enable"] if 'enable' in kwargs else True
+        self.file_ext = CACHE_FILE_EXT
+        self.hits = 0
+        self.misses = 0
+
+    # key of any printable values, e.g. file digest, project, sensor, version
+    @staticmethod
+    def make_key(*args) -> str:
+        return hashlib.blake2b(repr(args).encode(), digest_size=16).hexdigest()
+
+    def file_of(self, _key: str) -> str:
+        return os.path.join(self.path, _key + self.file_ext)
+
+    def read_file(self, _key: str, _file: str):
+        with open(_file, 'rb') as _fh:
+            return pickle.load(_fh)
+
+    def write_file(self, _key: str, _value, _fh):
+        pickle.dump(_value, _fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def get(self, _key: str):
+        if not self.enable:
+            return None
+        _file = self.file_of(_key)
+        try:
+            _value = self.read_file(_key, _file)
+            os.utime(_file)  # mtime is the last used time
+            self.hits += 1
+            self.logger.debug(f"cache hit: {_key}")
+            return _value
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as ex:  # broken or incompatible file, drop it
+            self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+            self.misses += 1
+            self.remove(_key)
+            return None
+
+    def put(self, _key: str, _value) -> bool:
+        if not self.enable:
+            return False
+        _file = self.file_of(_key)
+        _temp = f"{_file}.{os.getpid()}{CACHE_TEMP_EXT}"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(_temp, 'wb') as _fh:
+                self.write_file(_key, _value, _fh)
+            os.replace(_temp, _file)  # readers never see a half written file
+            self.logger.debug(f"cache put: {_key}, {os.path.getsize(_file)} bytes")
+            self.evict()
+            return True
+        except Exception as ex:
+            self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+            if os.path.exists(_temp):
+                os.remove(_temp)
+            return False
+
+    def remove(self, _key: str):
+        try:
+            os.remove(self.file_of(_key))
+        except OSError:
+            pass
+
+    '''
+        remove least recently used files until total size is not over max_size,
+        temp files left by a crash during put are removed once they are older than CACHE_TEMP_AGE,
+        newer ones may be written by other processes, they are counted in the total size
+    '''
+    def evict(self):
+        _files = list()
+        _total = 0
+        _now = time.time()
+        for _entry in os.scandir(self.path):
+            if not _entry.is_file():
+                continue
+            _stat = _entry.stat()
+            if _entry.name.endswith(CACHE_TEMP_EXT):
+                if _now - _stat.st_mtime > CACHE_TEMP_AGE and self.remove_file(_entry.path):
+                    continue
+                _total += _stat.st_size
+            elif _entry.name.endswith(self.file_ext):
+                _files.append([_stat.st_mtime_ns, _stat.st_size, _entry.path])
+                _total += _stat.st_size
+        for _mtime, _size, _file in sorted(_files):
+            if _total <= self.max_size:
+                break
+            if self.remove_file(_file):
+                _total -= _size
+                self.logger.debug(f"cache evict: {os.path.basename(_file)}")
+
+    # return True if the file is removed
+    def remove_file(self, _file: str) -> bool:
+        try:
+            os.remove(_file)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        if os.path.isdir(self.path):
+            for _entry in os.scandir(self.path):
+                if _entry.is_file() and (_entry.name.endswith(self.file_ext) or _entry.name.endswith(CACHE_TEMP_EXT)):
+                    self.remove_file(_entry.path)
+        self.hits = 0
+        self.misses = 0
+
+
+#
+# DataCache of dict values, numpy arrays (e.g. spectra) of each entry are saved in one npz file,
+# the other values (scalars, short lists) of all entries are kept in one json index file of the cache folder,
+# the index is saved by flush, once after a batch of get and put
+#
+class ArrayCache(DataCache):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.file_ext = ARRAY_FILE_EXT
+        # names of the arrays saved compressed, None: all, noisy signals hardly compress but slow down loading
+        self.compressed = kwargs["compressed"] if 'compressed' in kwargs else None
+        self.index = None  # {key: {name: value}}, loaded on first use
+        self.removed = set()  # keys dropped from the index since it was saved
+        self.dirty = False  # the index has changed since it was saved
+
+    def index_file(self) -> str:
+        return os.path.join(self.path, CACHE_INDEX_FILE)
+
+    # numpy scalars of the index as python values, other values not in json as text
+    @staticmethod
+    def index_value(val):
+        return val.item() if isinstance(val, np.generic) else str(val)
+
+    def read_index(self) -> dict:
+        try:
+            with open(self.index_file(), 'r') as _fh:
+                return json.load(_fh)
+        except (OSError, ValueError):  # no index yet, or broken, the entries are treated as missing
+            return dict()
+
+    def load_index(self) -> dict:
+        if self.index is None:
+            self.index = self.read_index()
+        return self.index
+
+    def drop_index(self, _key: str):
+        if self.load_index().pop(_key, None) is not None:
+            self.removed.add(_key)
+            self.dirty = True
+
+    '''
+        save the index if it has changed, entries saved by other processes since it was loaded are merged,
+        entries without their npz file are dropped
+        return: True if the index is saved or has not changed
+    '''
+    def flush(self) -> bool:
+        if not self.dirty:
+            return True
+        _temp = f"{self.index_file()}.{os.getpid()}{CACHE_TEMP_EXT}"
+        try:
+            _index = {**self.read_index(), **self.load_index()}
+            _index = {_key: val for _key, val in _index.items()
+                      if _key not in self.removed and os.path.exists(self.file_of(_key))}
+            os.makedirs(self.path, exist_ok=True)
+            with open(_temp, 'w') as _fh:
+                json.dump(_index, _fh, default=self.index_value)
+            os.replace(_temp, self.index_file())
+            self.index = _index
+            self.removed = set()
+            self.dirty = False
+            return True
+        except Exception as ex:
+            self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+            if os.path.exists(_temp):
+                os.remove(_temp)
+            return False
+
+    def read_file(self, _key: str, _file: str) -> dict:
+        _index = self.load_index()
+        if _key not in _index:  # not saved, or not flushed by another process yet
+            raise FileNotFoundError(_file)
+        try:
+            with np.load(_file, allow_pickle=False) as _npz:
+                _value = {name: _npz[name] for name in _npz.files}
+        except FileNotFoundError:  # removed by another process, the index entry is stale
+            self.drop_index(_key)
+            raise
+        _value.update(_index[_key])
+        return _value
+
+    def write_file(self, _key: str, _value: dict, _fh):
+        _arrays = {name: val for name, val in _value.items() if isinstance(val, np.ndarray) and val.ndim > 0}
+        # same layout as np.savez, so np.load reads it, but only the arrays in self.compressed are deflated
+        with zipfile.ZipFile(_fh, 'w') as _zip:
+            for name, val in _arrays.items():
+                _buf = io.BytesIO()
+                np.lib.format.write_array(_buf, val, allow_pickle=False)
+                _compress = self.compressed is None or name in self.compressed
+                _zip.writestr(name + ".npy", _buf.getvalue(),
+                              compress_type=zipfile.ZIP_DEFLATED if _compress else zipfile.ZIP_STORED,
+                              compresslevel=CACHE_COMPRESS_LEVEL if _compress else None)
+        # same python types as the values read from the saved index, e.g. float for np.float64, list for tuple
+        _values = {name: val for name, val in _value.items() if name not in _arrays}
+        self.load_index()[_key] = json.loads(json.dumps(_values, default=self.index_value))
+        self.removed.discard(_key)
+        self.dirty = True
+
+    def remove(self, _key: str):
+        super().remove(_key)
+        self.drop_index(_key)
+
+    # evict files, then drop the index of the removed files
+    def evict(self):
+        super().evict()
+        for _key in [_key for _key in self.load_index() if not os.path.exists(self.file_of(_key))]:
+            self.drop_index(_key)
+
+    def clear(self):
+        super().clear()
+        self.index = dict()
+        self.removed = set()
+        self.dirty = False
+        self.remove_file(self.index_file())
+
+
+#
+# outputs of pipeline stages in memory, for one session, the latest max_entries outputs are kept for each stage,
+# hits and misses are counted per stage, in hits and misses of the cache object
+#
+class StageCache:
+    def __init__(self, **kwargs):
+        self.logger = kwargs["logger"] if 'logger' in kwargs and kwargs['logger'] is not None else logging.getLogger()
+        self.max_entries = kwargs["max_entries"] if 'max_entries' in kwargs else STAGE_CACHE_ENTRIES
+        self.enable = kwargs["enable"] if 'enable' in kwargs else True
+        self.stages = list(kwargs["stages"]) if 'stages' in kwargs and kwargs['stages'] is not None else list()
+        self.entries = dict()  # {stage: OrderedDict({key: output})}, last used at the end
+        self.hits = {_stage: 0 for _stage in self.stages}  # {stage: count}, all stages are listed from the start
+        self.misses = {_stage: 0 for _stage in self.stages}
+
+    def get(self, _stage: str, _key: str):
+        if not self.enable:
+            return None
+        _entries = self.entries.get(_stage)
+        if _entries is None or _key not in _entries:
+            self.misses[_stage] = self.misses.get(_stage, 0) + 1
+            # the output of this miss is put next, drop the oldest now so the old and new outputs are not kept together
+            while _entries is not None and len(_entries) >= self.max_entries > 0:
+                _entries.popitem(last=False)
+            return None
+        _entries.move_to_end(_key)
+        self.hits[_stage] = self.hits.get(_stage, 0) + 1
+        self.logger.debug(f"stage cache hit: {_stage}")
+        return _entries[_key]
+
+    def put(self, _stage: str, _key: str, _value):
+        if not self.enable or self.max_entries <= 0:
+            return
+        _entries = self.entries.setdefault(_stage, collections.OrderedDict())
+        _entries[_key] = _value
+        _entries.move_to_end(_key)
+        while len(_entries) > self.max_entries:
+            _entries.popitem(last=False)
+
+    # {stage: [hits, misses]}, in the order of stages, then the other stages by name
+    def statistics(self) -> dict:
+        _others = sorted((set(self.hits) | set(self.misses)) - set(self.stages))
+        return {_stage: [self.hits.get(_stage, 0), self.misses.get(_stage, 0)] for _stage in self.stages + _others}
+
+    def clear(self):
+        self.entries = dict()
+        self.hits = {_stage: 0 for _stage in self.stages}
+        self.misses = {_stage: 0 for _stage in self.stages}
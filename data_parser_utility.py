@@ -9,6 +9,20 @@ from enum import IntEnum
 import json
 import re
 import csv
+import mmap
+import time
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 
 class OpCode(IntEnum):
@@ -36,6 +50,196 @@ ErrorMsg = {
     f"{ErrorCode.ERR_BAD_UNKNOWN}": "ErrorCode.ERR_BAD_UNKNOWN",
 }
 
+PARSER_VERSION = 1  # increase it when output of the parsers changes, so cached data of old parsers is not used
+DEFAULT_CHUNK_SIZE = 1 << 20  # characters read from raw log file each time
+LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"  # same as str.splitlines()
+# a whole line of 8 tab-separated "d.dddddd" values, same as re.match(r'^(\d\.\d{6}\t){8}$', line)
+EMG_LINE_PATTERN = re.compile(rf'(?<![^{LINE_BREAKS}])(?:\d\.\d{{6}}\t){{8}}(?![^{LINE_BREAKS}])')
+JSON_TAIL_SIZE = 4096  # json error within the tail of buffer may be an unfinished object
+JSON_BACKENDS = ["orjson", "simdjson", "json"]  # in order of preference
+# file formats of the converted data, feather and parquet need pyarrow
+DATA_FILE_FORMATS = ["csv", "feather", "parquet", "npz"]
+NPZ_COLUMNS_KEY = "__columns__"
+EMG_LINE_LENGTH = 8 * 9
+# ascii chars of LINE_BREAKS as [first, last] code ranges, "\n\v\f\r" and "\x1c\x1d\x1e"
+EMG_BREAK_RANGES = [[0x0a, 0x0d], [0x1c, 0x1e]]
+# valid char range of each column in "d.dddddd\t", and the weight of each digit
+EMG_CHAR_LOWER = np.tile(np.frombuffer(b"0.000000\t", dtype=np.uint8), 8)
+EMG_CHAR_RANGE = np.tile(np.frombuffer(b"9.999999\t", dtype=np.uint8), 8) - EMG_CHAR_LOWER
+EMG_DIGIT_WEIGHTS = np.array([10 ** 6, 0, 10 ** 5, 10 ** 4, 10 ** 3, 10 ** 2, 10, 1, 0], dtype=np.float32)
+# (72, 8) weights of all columns, a line as integer is below 2 ** 24, so float32 matmul of it is exact
+EMG_LINE_WEIGHTS = np.kron(np.eye(8, dtype=np.float32), EMG_DIGIT_WEIGHTS[:, None])
+
+# json backends already logged, the parsers are created per file and per worker, each backend is logged once
+logged_json_backends = set()
+
+
+#
+# json decoder used by the parsers, the first installed one of JSON_BACKENDS is used if no name is given
+# loads() takes str or utf-8 bytes and returns plain dict/list for all backends, errors are ValueError
+#
+class JsonBackend:
+    def __init__(self, name: str = None):
+        _available = self.available()
+        self.name = name if name in _available else _available[0]
+        self.loads = {
+            "orjson": orjson.loads if orjson is not None else None,
+            "simdjson": simdjson.loads if simdjson is not None else None,
+            "json": json.loads,
+        }[self.name]
+
+    @staticmethod
+    def available() -> list:
+        _modules = {"orjson": orjson, "simdjson": simdjson, "json": json}
+        return [name for name in JSON_BACKENDS if _modules[name] is not None]
+
+
+#
+# decoder of json "samples"([{"name": ..., "value": ...}, ...]) of one sensor schema, names are mapped to
+# column slots once, values are written into preallocated numpy columns without building rows
+#
+class SampleDecoder:
+    def __init__(self, _ref_names: list, _expect_columns: list):
+        self.columns = list(_expect_columns)
+        # -1: valid name but not an expected column
+        self.slots = {name: -1 for name in _ref_names}
+        self.slots.update({name: i for i, name in enumerate(self.columns)})
+
+    '''
+        _samples: list of samples, a sample with any name not in _ref_names is skipped
+        return dict of column name: array, a column is int64 if all its values are json integers,
+        object if any value is not a number(e.g. string), otherwise float64, a missing value is NaN
+    '''
+    def decode(self, _samples: list) -> dict:
+        _slots = self.slots
+        _values = np.full((len(self.columns), len(_samples)), np.nan)
+        _cols = list(_values)
+        _floats = [False] * len(self.columns)
+        _objects = [False] * len(self.columns)
+        _row = 0
+        for sample in _samples:
+            try:
+                _items = [(_slots[item["name"]], item["value"]) for item in sample]
+            except KeyError:
+                continue
+            for _slot, _value in _items:
+                if _slot >= 0:
+                    try:
+                        _cols[_slot][_row] = _value
+                    except (TypeError, ValueError):  # not a number, only this column falls back to objects
+                        _cols[_slot] = _cols[_slot].astype(object)
+                        _cols[_slot][_row] = _value
+                        _objects[_slot] = True
+                    if type(_value) is not int:
+                        _floats[_slot] = True
+            _row += 1
+        _result = dict()
+        for i, name in enumerate(self.columns):
+            _col = _cols[i][:_row]
+            if not _floats[i] and not _objects[i] and not np.isnan(_col).any():
+                _col = _col.astype(np.int64)
+            _result[name] = _col
+        return _result
+
+
+#
+# read raw log data block by block, so peak memory is bounded by chunk size instead of file size
+# it can be iterated more than once, file is re-opened for each iteration
+# line and json sample parsers keep one block in memory, a json document(Bali family) or csv table(convert)
+# keeps only the document or the parsed rows, text given as _data is already in memory as a whole
+#
+class RawDataReader:
+    def __init__(self, _source_file: str = None, _data: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.source_file = _source_file
+        self.data = _data
+        self.chunk_size = int(chunk_size) if chunk_size is not None and int(chunk_size) > 0 else DEFAULT_CHUNK_SIZE
+
+    def __iter__(self):
+        return self.lines()
+
+    def blocks(self):
+        if self.source_file is not None:
+            with open(self.source_file, 'r', errors='ignore') as _fh:
+                while True:
+                    _block = _fh.read(self.chunk_size)
+                    if not _block:
+                        break
+                    yield _block
+        elif self.data is not None:
+            for i in range(0, len(self.data), self.chunk_size):
+                yield self.data[i: i + self.chunk_size]
+
+    # blocks which end at a line boundary, the unfinished line is moved to next block
+    def line_blocks(self):
+        _rest = ""
+        for _block in self.blocks():
+            _block = _rest + _block
+            _end = max(_block.rfind(c) for c in LINE_BREAKS) + 1
+            _rest = _block[_end:]
+            if _end > 0:
+                yield _block[:_end]
+        if _rest:
+            yield _rest
+
+    # same lines as str.splitlines(), but only keep one block and the unfinished line in memory
+    def lines(self, keepends: bool = False):
+        _rest = ""
+        for _block in self.blocks():
+            _lines = (_rest + _block).splitlines(True)
+            _rest = ""
+            # last line is not finished, or "\r" may be followed by "\n" in next block
+            if _lines[-1][-1] not in LINE_BREAKS or _lines[-1][-1] == "\r":
+                _rest = _lines.pop()
+            for _line in _lines:
+                yield _line if keepends else _line.splitlines()[0]
+        for _line in _rest.splitlines(True):
+            yield _line if keepends else _line.splitlines()[0]
+
+    # return end offset of the first match, -1 if not found
+    def search(self, _reg, flags=re.MULTILINE) -> int:
+        _offset = 0  # offset of _buf in whole data
+        _buf = ""
+        for _block in self.blocks():
+            _buf = _buf + _block
+            matches = re.search(_reg, _buf, flags)
+            if matches:
+                return _offset + matches.end()
+            # keep last chunk, in case a match crosses the block boundary
+            _keep = min(len(_buf), self.chunk_size)
+            _offset += len(_buf) - _keep
+            _buf = _buf[len(_buf) - _keep:]
+        return -1
+
+    # map raw log file into memory read only, pages are loaded by OS on demand instead of read up-front
+    def mapped(self) -> mmap.mmap | None:
+        if self.source_file is None or os.path.getsize(self.source_file) == 0:  # can't map an empty file
+            return None
+        with open(self.source_file, 'rb') as _fh:
+            return mmap.mmap(_fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # text from the first "{" to the last "}", read block by block, text around the document is not kept
+    def json_document(self) -> str:
+        _parts = list()
+        for _block in self.blocks():
+            if not len(_parts):
+                _start = _block.find("{")
+                if _start < 0:
+                    continue
+                _block = _block[_start:]
+            _parts.append(_block)
+        while len(_parts) and _parts[-1].rfind("}") < 0:
+            _parts.pop()
+        if not len(_parts):
+            return ""
+        _parts[-1] = _parts[-1][:_parts[-1].rfind("}") + 1]
+        return "".join(_parts)
+
+    def read(self) -> str | None:
+        if self.source_file is not None:
+            with open(self.source_file, 'r', errors='ignore') as _fh:
+                return _fh.read()
+        return self.data
+
 
 #
 # this class is base on Malibu project, other project should inherit from this class
@@ -48,6 +252,13 @@ class RawSensorDataParser:
         self.source_file = None
         self.target_file = None
         self.data = None
+        self.chunk_size = kwargs["chunk_size"] if 'chunk_size' in kwargs and kwargs['chunk_size'] else DEFAULT_CHUNK_SIZE
+        self.use_mmap = kwargs["use_mmap"] if 'use_mmap' in kwargs else True
+        self.json = JsonBackend(kwargs["json_backend"] if 'json_backend' in kwargs else None)
+        if self.json.name not in logged_json_backends:
+            logged_json_backends.add(self.json.name)
+            self.logger.info(f"json backend: {self.json.name}")
+        self.sample_decoders = dict()
 
         self.sensor_data_func = {
             "emg": [self.extract_emg_data, self.convert_emg_data],
@@ -78,12 +289,17 @@ class RawSensorDataParser:
             "def": [r'\{(?:[^{}]*?"data": \[)', "FT> {"],
         }
 
+    # kwargs to create a parser with the same settings, e.g. in a worker process, logger is not included
+    def parser_kwargs(self) -> dict:
+        return {"chunk_size": self.chunk_size, "use_mmap": self.use_mmap, "json_backend": self.json.name}
+
     '''
-        _source_file: raw data file pull path, in text format
-        _data: input data, in DataFrame format
+        _source_file: raw data file pull path, in text format, read in blocks of self.chunk_size,
+                      memory is bounded as described in RawDataReader
+        _data: input data, in text format, used as a whole
         _sensor: sensor name
         _project: project name
-        _target_file: full file path to save the converted data, in csv format
+        _target_file: full file path to save the converted data, format by extension, see save_data_file
     '''
     def extract_sensor_data(self, _source_file: str = None, _data: pd.DataFrame = None, _sensor: str = None,
                             _project: str = None, _target_file: str = None) -> (ErrorCode, pd.DataFrame | None):
@@ -97,13 +313,12 @@ class RawSensorDataParser:
             # get data from file fist, if not available, get from _data
             self.data = None
             if _source_file is not None and os.path.exists(_source_file):
-                _fh = open(_source_file, 'r', errors='ignore')
-                self.data = _fh.read()
+                self.data = RawDataReader(_source_file, chunk_size=self.chunk_size)
             if self.data is None:
                 self.data = _data
             err_code, _df = self.sensor_data_func[self.sensor][OpCode.extract]()
             if _target_file is not None and err_code == ErrorCode.ERR_NO_ERROR:
-                _df.to_csv(_target_file, index=False)
+                save_data_file(_df, _target_file)
             # self.target_file = None
             # self.source_file = None
             return err_code, _df
@@ -113,11 +328,11 @@ class RawSensorDataParser:
             return ErrorCode.ERR_BAD_DATA, None
 
     '''
-        _source_file: raw data file pull path, in csv format
-        _data: input data, in DataFrame format
+        _source_file: raw data file pull path, in csv format, read line by line into csv rows
+        _data: input data, in text format
         _sensor: sensor name
         _project: project name
-        _target_file: full file path to save the converted data, in csv format
+        _target_file: full file path to save the converted data, format by extension, see save_data_file
     '''
     def convert_sensor_data(self, _source_file=None, _data: pd.DataFrame = None, _sensor: str = None,
                             _project: str = None, _target_file: str = None) -> (ErrorCode, pd.DataFrame | None):
@@ -131,13 +346,12 @@ class RawSensorDataParser:
             # get data from file fist, if not available, get from _data
             self.data = None
             if _source_file is not None and os.path.exists(_source_file):
-                _fh = open(_source_file, 'r', errors='ignore')
-                self.data = _fh.read()
+                self.data = RawDataReader(_source_file, chunk_size=self.chunk_size)
             if self.data is None:
                 self.data = _data
             err_code, _df = self.sensor_data_func[self.sensor][OpCode.convert]()
             if _target_file is not None and err_code == ErrorCode.ERR_NO_ERROR:
-                _df.to_csv(_target_file, index=False)
+                save_data_file(_df, _target_file)
             # self.target_file = None
             return err_code, _df
         except Exception as ex:
@@ -148,16 +362,18 @@ class RawSensorDataParser:
     # extract data from command raw output
     def extract_emg_data(self):
         try:
-            _data_lines = self.data.splitlines()
             values = list()
-            for line in _data_lines:
-                if re.match(r'^(\d\.\d{6}\t){8}$', line):
-                    _row = [float(val) for val in line.strip().split()]
-                    values.append(_row)
+            for _block in self.data_reader().line_blocks():
+                _values = self.parse_emg_block(_block)
+                if len(_values):
+                    values.append(_values)
+            if not len(values):
+                self.logger.error("no valid emg data found!")
+                return ErrorCode.ERR_BAD_DATA, None
 
             col = self.ref_key_names["emg"]
 
-            _df = pd.DataFrame(np.array(values), columns=col)
+            _df = pd.DataFrame(np.concatenate(values), columns=col)
             self.logger.debug(f"{__name__}: {len(_df)}")
             return ErrorCode.ERR_NO_ERROR, _df
         except Exception as ex:
@@ -170,31 +386,20 @@ class RawSensorDataParser:
             if _err != ErrorCode.ERR_NO_ERROR:
                 return ErrorCode.ERR_BAD_DATA, None
 
-            mes_samples = {}
-            values = {}
-            for obj in _json_data:
-                err_code, _mes = self.read_value(obj["samples"], "measurement")
-                if err_code == ErrorCode.ERR_NO_ERROR:
-                    if str(_mes) in mes_samples:
-                        mes_samples[str(_mes)].append(obj["samples"])
-                    else:
-                        mes_samples[str(_mes)] = [obj["samples"]]
+            _err, _values = self.extract_df_columns([obj["samples"] for obj in _json_data], "ppg")
+            if _err != ErrorCode.ERR_NO_ERROR:
+                return _err, None
+            # split samples by measurement, in the order of first appearance
+            _mes = _values["measurement"]
             _expected = self.ref_key_names["ppg"][1:]
-            for _key in mes_samples:
-                _err, _values = self.extract_df_values(mes_samples[_key], self.ref_key_names["ppg"], _expected)
-                if _err == ErrorCode.ERR_NO_ERROR:
-                    values[_key] = _values
-
-            _keys = list(values.keys())
-            values_all = values[_keys[0]]
-            col = []
-            for _key in _keys:
-                if _key != _keys[0]:
-                    values_all = [x + y for x, y in zip(values_all, values[_key])]
-                col = col+["MES"+_key+"_"+val for val in _expected]
-            _df = pd.DataFrame(np.array(values_all), columns=col)
-            self.logger.debug(f"{__name__}: {len(_df)}")
-            return ErrorCode.ERR_NO_ERROR, _df
+            columns = dict()
+            for _key in pd.unique(_mes[~pd.isna(_mes)]):
+                _mask = _mes == _key
+                # id is float if any sample has no measurement, name it as the json integer, e.g. MES1 not MES1.0
+                _id = int(_key) if isinstance(_key, (float, np.floating)) and float(_key).is_integer() else _key
+                for val in _expected:
+                    columns[f"MES{_id}_{val}"] = _values[val][_mask]
+            return self.columns_to_df(columns)
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
             return ErrorCode.ERR_BAD_DATA, None
@@ -252,18 +457,17 @@ class RawSensorDataParser:
                 elif obj["desc"] == "IMU temperature data":
                     samples_temper.append(obj["samples"])
             _gyro_expected = self.ref_key_names["imu"][0:4]
-            _err1, values_gyro = self.extract_df_values(samples_gyro, self.ref_key_names["imu"], _gyro_expected)
+            _err1, values_gyro = self.extract_df_columns(samples_gyro, "imu", _gyro_expected)
             _acc_expected = self.ref_key_names["imu"][1:4]
-            _err2, values_acc = self.extract_df_values(samples_acc, self.ref_key_names["imu"], _acc_expected)
+            _err2, values_acc = self.extract_df_columns(samples_acc, "imu", _acc_expected)
             _temper_expected = self.ref_key_names["imu"][4:]
-            _err3, values_temper = self.extract_df_values(samples_temper, self.ref_key_names["imu"], _temper_expected)
+            _err3, values_temper = self.extract_df_columns(samples_temper, "imu", _temper_expected)
             if _err1 == ErrorCode.ERR_NO_ERROR and _err2 == ErrorCode.ERR_NO_ERROR and _err3 == ErrorCode.ERR_NO_ERROR:
-                values_all = [x + y + z for x, y, z in zip(values_gyro, values_acc, values_temper)]
-                col = ([_gyro_expected[0]] + ["gyro_" + x for x in _gyro_expected[1:]] +
-                       ["acc_" + x for x in _acc_expected] + _temper_expected)
-                _df = pd.DataFrame(np.array(values_all), columns=col)
-                self.logger.debug(f"{__name__}: {len(_df)}")
-                return ErrorCode.ERR_NO_ERROR, _df
+                columns = {_gyro_expected[0]: values_gyro[_gyro_expected[0]]}
+                columns.update({"gyro_" + x: values_gyro[x] for x in _gyro_expected[1:]})
+                columns.update({"acc_" + x: values_acc[x] for x in _acc_expected})
+                columns.update(values_temper)
+                return self.columns_to_df(columns)
             else:
                 return ErrorCode.ERR_BAD_DATA, None
         except Exception as ex:
@@ -276,29 +480,15 @@ class RawSensorDataParser:
             if _err != ErrorCode.ERR_NO_ERROR:
                 return ErrorCode.ERR_BAD_DATA, None
 
-            samples_sensor0 = []
-            samples_sensor1 = []
-            for obj in _json_data:
-                err_code, _mes = self.read_value(obj["samples"], "Sensor")
-                if err_code == ErrorCode.ERR_NO_ERROR and _mes == 0:
-                    samples_sensor0.append(obj["samples"])
-                elif err_code == ErrorCode.ERR_NO_ERROR and _mes == 1:
-                    samples_sensor1.append(obj["samples"])
-                else:
-                    continue
+            _err, _values = self.extract_df_columns([obj["samples"] for obj in _json_data], "bti")
+            if _err != ErrorCode.ERR_NO_ERROR:
+                return _err, None
             _expected = self.ref_key_names["bti"][:-1]
-            # print(f"{samples_sensor0}")
-            _err0, values_0 = self.extract_df_values(samples_sensor0, self.ref_key_names["bti"], _expected)
-            _err1, values_1 = self.extract_df_values(samples_sensor1, self.ref_key_names["bti"], _expected)
-            if _err0 == ErrorCode.ERR_NO_ERROR and _err1 == ErrorCode.ERR_NO_ERROR:
-                values_all = [x + y for x, y in zip(values_0, values_1)]
-                col = (["sensor0_"+val for val in _expected] + ["sensor1_" + val for val in _expected])
-                # print(f"columns name:{col}")
-                _df = pd.DataFrame(np.array(values_all), columns=col)
-                self.logger.debug(f"{__name__}: {len(_df)}")
-                return ErrorCode.ERR_NO_ERROR, _df
-            else:
-                return ErrorCode.ERR_BAD_DATA, None
+            _mask0 = _values["Sensor"] == 0
+            _mask1 = _values["Sensor"] == 1
+            columns = {"sensor0_" + val: _values[val][_mask0] for val in _expected}
+            columns.update({"sensor1_" + val: _values[val][_mask1] for val in _expected})
+            return self.columns_to_df(columns)
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
             return ErrorCode.ERR_BAD_DATA, None
@@ -323,104 +513,233 @@ class RawSensorDataParser:
 
     # convert adc code to target value, and save to csv file
     def convert_emg_data(self):
-        return ErrorCode.ERR_NO_ERROR, self.data
+        return ErrorCode.ERR_NO_ERROR, self.data_text()
 
     def convert_ppg_data(self):
-        return ErrorCode.ERR_NO_ERROR, self.data
+        return ErrorCode.ERR_NO_ERROR, self.data_text()
 
     def convert_imu_data(self):
-        return ErrorCode.ERR_NO_ERROR, self.data
+        return ErrorCode.ERR_NO_ERROR, self.data_text()
 
     def convert_alt_data(self):
-        return ErrorCode.ERR_NO_ERROR, self.data
+        return ErrorCode.ERR_NO_ERROR, self.data_text()
 
     def convert_mag_data(self):
-        return ErrorCode.ERR_NO_ERROR, self.data
+        return ErrorCode.ERR_NO_ERROR, self.data_text()
 
     def convert_bti_data(self):
-        return ErrorCode.ERR_NO_ERROR, self.data
+        return ErrorCode.ERR_NO_ERROR, self.data_text()
 
     def convert_als_data(self):
-        return ErrorCode.ERR_NO_ERROR, self.data
+        return ErrorCode.ERR_NO_ERROR, self.data_text()
+
+    # self.data can be RawDataReader or text
+    def data_reader(self) -> RawDataReader:
+        if isinstance(self.data, RawDataReader):
+            return self.data
+        return RawDataReader(_data=self.data, chunk_size=self.chunk_size)
+
+    # convert all lines of 8 "d.dddddd\t" values in a block (ends at line boundary) to (rows, 8) array
+    @staticmethod
+    def parse_emg_block(_block: str) -> np.ndarray:
+        if not _block.isascii():  # \d also matches other unicode digits, leave them to regex and float()
+            _rows = EMG_LINE_PATTERN.findall(_block)
+            return np.array([float(val) for val in "".join(_rows).split()]).reshape(-1, 8)
+        _buf = np.frombuffer(_block.encode("ascii"), dtype=np.uint8)
+        if len(_buf) < EMG_LINE_LENGTH:
+            return np.empty((0, 8))
+        # range check by uint8 wraparound, cheaper than np.isin() which converts every char to int
+        _is_break = np.zeros(len(_buf), dtype=bool)
+        for _first, _last in EMG_BREAK_RANGES:
+            _is_break |= (_buf - np.uint8(_first)) <= np.uint8(_last - _first)
+        _breaks = np.flatnonzero(_is_break)
+        _starts = np.concatenate(([0], _breaks + 1))
+        _ends = np.append(_breaks, len(_buf))
+        _starts = _starts[_ends - _starts == EMG_LINE_LENGTH]
+        # candidate lines with the right length, as (rows, 72) chars minus the lower bound of each char,
+        # so it is the digit value at digit positions, 0 at "." and "\t"
+        _lines = np.lib.stride_tricks.sliding_window_view(_buf, EMG_LINE_LENGTH)[_starts] - EMG_CHAR_LOWER
+        _lines = _lines[(_lines <= EMG_CHAR_RANGE).all(axis=1)]
+        # take the 7 digits as an integer then scale it, division of exact integers is correctly rounded,
+        # so the result is same as float()
+        return (_lines.astype(np.float32) @ EMG_LINE_WEIGHTS).astype(np.float64) / 10 ** 6
+
+    # csv rows of the data, parsed line by line, the text is not read as a whole
+    def data_rows(self) -> list:
+        return list(csv.reader(self.data_reader().lines(keepends=True)))
+
+    # whole raw log text
+    def data_text(self) -> str | None:
+        if isinstance(self.data, RawDataReader):
+            return self.data.read()
+        return self.data
+
+    # json document between the first "{" and the last "}"
+    def extract_json_object(self) -> dict:
+        if self.use_mmap and isinstance(self.data, RawDataReader):
+            _mm = self.data.mapped()
+            if _mm is not None:
+                with _mm:
+                    start_idx = _mm.find(b"{")
+                    end_idx = _mm.rfind(b"}")
+                    self.logger.debug(f"mmap: {start_idx}, {end_idx}")
+                    _doc = _mm[start_idx: end_idx + 1]
+                try:
+                    return self.json.loads(_doc)
+                except ValueError:  # not utf-8, e.g. Chinese in Windows, same as text mode with errors='ignore'
+                    return self.json.loads(_doc.decode(errors='ignore'))
+        if isinstance(self.data, RawDataReader):
+            return self.json.loads(self.data.json_document())
+        _text = self.data
+        start_idx = _text.find("{")
+        end_idx = _text.rfind("}")
+        self.logger.debug(f"{start_idx}, {end_idx}")
+        return self.json.loads(_text[start_idx: end_idx + 1])
 
     def extract_json_data(self, _data, _reg=None):
         try:
-            is_json = False
-            json_obj = list()
-            json_decoded = list()
-            start_index = 0
-            if _reg is not None:
-                for reg in _reg:
-                    matches = re.search(reg, _data, re.MULTILINE)
-                    if matches:
-                        self.logger.info(f"find {matches}")
-                        start_index = matches.end()
-                        break
-            _data_lines = _data[start_index:].splitlines()
-            for line in _data_lines:
-                if line.startswith("      {"):
-                    is_json = True
-                    json_obj = list()
-                elif is_json and line.startswith("      },"):  # ignore "}," if previous "{" is not found
-                    is_json = False
-                    json_obj.append("      }")
-                    _json_data = json.loads("\n".join(json_obj))
-                    json_decoded.append(_json_data)
-                if is_json:
-                    json_obj.append(line)
+            json_decoded = list(self.iter_json_data(_data, _reg))
+            self.logger.debug(f"{__name__}: {len(json_decoded)}")
             return ErrorCode.ERR_NO_ERROR, json_decoded
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
             return ErrorCode.ERR_BAD_DATA, None
 
+    '''
+        yield json objects which are elements of an array(e.g. "data": [{...}, {...}]) one by one,
+        scan starts from the end of the first matched pattern in _reg,
+        each object is decoded from the buffer by offset, only one block and the unfinished object is kept in memory,
+        scan goes on from the error of a bad or unfinished object till the end of data
+        _data: RawDataReader or text
+        _reg: list of patterns, the first matched one is used
+    '''
+    def iter_json_data(self, _data, _reg=None):
+        _reader = _data if isinstance(_data, RawDataReader) else RawDataReader(_data=_data,
+                                                                                chunk_size=self.chunk_size)
+        start_index = 0
+        if _reg is not None:
+            for reg in _reg:
+                _end = _reader.search(reg)
+                if _end >= 0:
+                    self.logger.info(f"find {reg} at {_end}")
+                    start_index = _end
+                    break
+        _decoder = json.JSONDecoder()  # stdlib only, the other backends can't decode an object at an offset
+        _blocks = _reader.blocks()
+        _buf = ""
+        _prev = ""  # last non-space char before current position
+        _skipped = 0
+        for _block in _blocks:  # skip text before start_index
+            if _skipped + len(_block) > start_index:
+                _prev = _block[:start_index - _skipped].rstrip()[-1:] or _prev
+                _buf = _block[start_index - _skipped:]
+                break
+            _skipped += len(_block)
+            _prev = _block.rstrip()[-1:] or _prev
+        _pos = 0
+        _eof = False
+        while True:
+            _idx = _buf.find("{", _pos)
+            if _idx < 0:
+                _prev = _buf[_pos:].rstrip()[-1:] or _prev
+                _buf = next(_blocks, None)
+                if _buf is None:
+                    return
+                _pos = 0
+                continue
+            _prev = _buf[_pos:_idx].rstrip()[-1:] or _prev
+            if _prev not in ("[", ","):  # not an array element, e.g. "FT> {", look into it
+                _pos = _idx + 1
+                _prev = "{"
+                continue
+            try:
+                _obj, _pos = _decoder.raw_decode(_buf, _idx)
+            except json.JSONDecodeError as ex:
+                # bad json in the middle, e.g. "{" in text, or no more data to finish it, go on from the error,
+                # the valid part before the error is not looked into, so its nested objects are not taken
+                if ex.pos < len(_buf) - JSON_TAIL_SIZE or _eof:
+                    if _eof:
+                        self.logger.warning(f"ignore bad or unfinished json object at the end: {ex}")
+                    else:
+                        self.logger.debug(f"not a json object at {_idx}: {ex}")
+                    _pos = max(ex.pos, _idx + 1)
+                    _prev = _buf[_idx:_pos].rstrip()[-1:]
+                    continue
+                # object is not finished in this block, read more
+                _block = next(_blocks, None)
+                _eof = _block is None
+                _buf = _buf[_idx:] + (_block or "")
+                _pos = 0
+                continue
+            _prev = "}"
+            yield _obj
+
     def convert_json_to_df(self, _json_data, sensor=None):
         try:
             samples = [obj["samples"] for obj in _json_data]
-            _err, values = self.extract_df_values(samples, self.ref_key_names[sensor], self.ref_key_names[sensor])
+            _err, values = self.extract_df_columns(samples, sensor)
             if _err == ErrorCode.ERR_NO_ERROR:
-                _df = pd.DataFrame(np.array(values), columns=self.ref_key_names[sensor])
-                self.logger.debug(f"{__name__}: {sensor}: {len(_df)}")
-                return ErrorCode.ERR_NO_ERROR, _df
+                return self.columns_to_df(values)
             else:
                 return _err, None
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
             return ErrorCode.ERR_BAD_DATA, None
 
-    def extract_df_values(self, _samples, _ref_names, _expect_columns):
+    '''
+        _samples: list of json "samples"
+        _sensor: sensor name, its ref_key_names is the schema
+        _expect_columns: columns to extract, all names in the schema by default
+    '''
+    def extract_df_columns(self, _samples, _sensor, _expect_columns=None) -> (ErrorCode, dict):
         try:
-            values_all = list()
-            for sample in _samples:
-                # print(sample)
-                is_valid = True
-                for item in sample:
-                    # print(f"item:{item}")
-                    if item["name"] not in _ref_names:
-                        is_valid = False
-                        break
-                    else:
-                        continue
-                if is_valid:
-                    values_row = [item["value"] for item in sample if item["name"] in _expect_columns]
-                    values_all.append(values_row)
-            self.logger.debug(f"{__name__}: {len(values_all)}")
-            return ErrorCode.ERR_NO_ERROR, values_all
+            _key = (_sensor, tuple(_expect_columns or self.ref_key_names[_sensor]))
+            if _key not in self.sample_decoders:
+                self.sample_decoders[_key] = SampleDecoder(self.ref_key_names[_sensor], list(_key[1]))
+            columns = self.sample_decoders[_key].decode(_samples)
+            self.logger.debug(f"{__name__}: {len(_samples)}")
+            return ErrorCode.ERR_NO_ERROR, columns
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
-            return ErrorCode.ERR_BAD_DATA, []
+            return ErrorCode.ERR_BAD_DATA, dict()
+
+    # columns to DataFrame, rows are cut to the shortest column, all number columns have the same dtype
+    def columns_to_df(self, _columns: dict) -> (ErrorCode, pd.DataFrame | None):
+        _rows = min([len(val) for val in _columns.values()], default=0)
+        if _rows == 0:
+            self.logger.error(f"no valid {self.sensor} sample")
+            return ErrorCode.ERR_BAD_DATA, None
+        _numbers = [val for val in _columns.values() if val.dtype != object]
+        _dtype = np.result_type(*_numbers) if len(_numbers) else object
+        _df = pd.DataFrame({key: val[:_rows].astype(_dtype if val.dtype != object else object, copy=False)
+                            for key, val in _columns.items()}, copy=False)
+        self.logger.debug(f"{__name__}: {self.sensor}: {len(_df)}")
+        return ErrorCode.ERR_NO_ERROR, _df
 
-    def read_value(self, _sample, _name):
+    '''
+        decompress delta encoded emg "adc_data", the layout of each row is [ch, ts, ch, ts, ...]
+        _arr: flat adc_data array
+        _ch_num: channel number, each channel takes 2 columns(value, timestamp)
+        _columns: column names of the output DataFrame, length must be _ch_num*2
+    '''
+    def decompress_emg_data(self, _arr, _ch_num: int, _columns: list) -> (ErrorCode, pd.DataFrame | None):
         try:
-            for item in _sample:
-                if item["name"] == _name:
-                    self.logger.debug(f"value of [{_name}] is {item['value']}")
-                    return ErrorCode.ERR_NO_ERROR, item["value"]
-                else:
-                    continue
-            return ErrorCode.ERR_BAD_DATA, ErrorCode.ERR_BAD_UNKNOWN
+            if len(_columns) != _ch_num * 2:
+                self.logger.error(f"columns number {len(_columns)} not match channel number {_ch_num}")
+                return ErrorCode.ERR_BAD_ARGS, None
+            output_arr = np.reshape(_arr, (-1, _ch_num * 2))
+            # Decompress timestamps, ts of 1st channel is delta to previous row,
+            # ts of other channels are delta to ts of 1st channel in the same row
+            output_arr[:, 1] = np.cumsum(output_arr[:, 1])
+            output_arr[:, 3::2] += output_arr[:, 1:2]
+            # Decompress channel data, each value is delta to previous row
+            output_arr[:, 0::2] = np.cumsum(output_arr[:, 0::2], axis=0)
+
+            df = pd.DataFrame(output_arr, columns=_columns)
+            return ErrorCode.ERR_NO_ERROR, df
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
-            return ErrorCode.ERR_BAD_DATA, ErrorCode.ERR_BAD_UNKNOWN
+            return ErrorCode.ERR_BAD_DATA, None
 
 
 class MalibuSensorDataParser(RawSensorDataParser):
@@ -435,31 +754,17 @@ class BaliSensorDataParser(RawSensorDataParser):
                 self.logger.error("data is None!")
                 return ErrorCode.ERR_BAD_DATA, None
 
-            start_idx = self.data.find("{")
-            end_idx = self.data.rfind("}")
             ch_num = 20
-            self.logger.debug(f"{start_idx}, {end_idx}")
-            js_obj = json.loads(self.data[start_idx: end_idx + 1])
+            js_obj = self.extract_json_object()
             arr = np.array(js_obj["output"]["adc_data"])
             self.logger.debug(f"arr length {len(arr)}")
-            output_arr = np.reshape(arr, (-1, ch_num*2))
-            base_timestamp = 0
-            # Decompress timestamps
-            for i in range(len(output_arr)):
-                output_arr[i][1] = output_arr[i][1] + base_timestamp
-                base_timestamp = output_arr[i][1]
-                for j in range(1, ch_num):
-                    output_arr[i][2 * j + 1] = output_arr[i][2 * j + 1] + base_timestamp
-            # Decompress channel data
-            for i in range(1, len(output_arr)):
-                for j in range(0, ch_num):
-                    output_arr[i][2 * j] = output_arr[i][2 * j] + output_arr[i - 1][2 * j]
-
-            df = pd.DataFrame(output_arr)
-            df.columns = ["ch0", "ts0", "ch1", "ts1", "ch2", "ts2", "ch3", "ts3", "ch4", "ts4", "ch5", "ts5", "ch6",
-                          "ts6", "ch7", "ts7", "ch8", "ts8", "ch9", "ts9", "ch10", "ts10", "ch11", "ts11",
-                          "ch12", "ts12", "ch13", "ts13", "ch14", "ts14", "ch15", "ts15", "ch16", "ts16", "ch17",
-                          "ts17", "ch18", "ts18", "ch19", "ts19"]
+            columns = ["ch0", "ts0", "ch1", "ts1", "ch2", "ts2", "ch3", "ts3", "ch4", "ts4", "ch5", "ts5", "ch6",
+                       "ts6", "ch7", "ts7", "ch8", "ts8", "ch9", "ts9", "ch10", "ts10", "ch11", "ts11",
+                       "ch12", "ts12", "ch13", "ts13", "ch14", "ts14", "ch15", "ts15", "ch16", "ts16", "ch17",
+                       "ts17", "ch18", "ts18", "ch19", "ts19"]
+            _err, df = self.decompress_emg_data(arr, ch_num, columns)
+            if _err != ErrorCode.ERR_NO_ERROR:
+                return _err, None
             self.logger.debug(f"{__name__}: {len(df)}")
             return ErrorCode.ERR_NO_ERROR, df
         except Exception as ex:
@@ -478,10 +783,7 @@ class BaliSensorDataParser(RawSensorDataParser):
                 self.logger.error("Data is None or sensor is not supported!")
                 return ErrorCode.ERR_BAD_DATA, None
 
-            start_idx = self.data.find("{")
-            end_idx = self.data.rfind("}")
-            self.logger.debug(f"{start_idx}, {end_idx}")
-            js_obj = json.loads(self.data[start_idx: end_idx + 1])
+            js_obj = self.extract_json_object()
             output_arr = [[],]
 
             if "ppg_data" not in js_obj["output"]:
@@ -517,10 +819,7 @@ class BaliSensorDataParser(RawSensorDataParser):
                 self.logger.error("Data is None or sensor is not supported!")
                 return ErrorCode.ERR_BAD_DATA, None
 
-            start_idx = self.data.find("{")
-            end_idx = self.data.rfind("}")
-            self.logger.debug(f"{start_idx}, {end_idx}")
-            js_obj = json.loads(self.data[start_idx: end_idx + 1])
+            js_obj = self.extract_json_object()
             output_arr = []
             for key in json_keys:
                 if key not in js_obj["output"]:
@@ -556,10 +855,7 @@ class BaliSensorDataParser(RawSensorDataParser):
                 self.logger.error("Data is None or sensor is not supported!")
                 return ErrorCode.ERR_BAD_DATA, None
 
-            start_idx = self.data.find("{")
-            end_idx = self.data.rfind("}")
-            self.logger.debug(f"{start_idx}, {end_idx}")
-            js_obj = json.loads(self.data[start_idx: end_idx + 1])
+            js_obj = self.extract_json_object()
             output_arr = []
             for key in sensor_param[_sensor]:
                 if key not in js_obj["output"]:
@@ -578,9 +874,10 @@ class BaliSensorDataParser(RawSensorDataParser):
             return ErrorCode.ERR_BAD_DATA, None
 
     def convert_emg_data(self):
-        df_data = pd.DataFrame(self.data[1:], columns=self.data[0])
+        _rows = self.data_rows()
+        df_data = pd.DataFrame(_rows[1:], columns=_rows[0]).astype(float)
         df_data = (df_data.sub(4096)).div(4096)
-        return df_data
+        return ErrorCode.ERR_NO_ERROR, df_data
 
 
 class TychoSensorDataParser(RawSensorDataParser):
@@ -589,31 +886,17 @@ class TychoSensorDataParser(RawSensorDataParser):
 
     def extract_emg_data(self):
         try:
-            start_idx = self.data.find("{")
-            end_idx = self.data.rfind("}")
             ch_num = 20
-            self.logger.debug(f"{start_idx}, {end_idx}")
-            js_obj = json.loads(self.data[start_idx: end_idx + 1])
+            js_obj = self.extract_json_object()
             arr = np.array(js_obj["output"]["adc_data"])
             self.logger.debug(f"arr length {len(arr)}")
-            output_arr = np.reshape(arr, (-1, ch_num*2))
-            base_timestamp = 0
-            # Decompress timestamps
-            for i in range(len(output_arr)):
-                output_arr[i][1] = output_arr[i][1] + base_timestamp
-                base_timestamp = output_arr[i][1]
-                for j in range(1, ch_num):
-                    output_arr[i][2 * j + 1] = output_arr[i][2 * j + 1] + base_timestamp
-            # Decompress channel data
-            for i in range(1, len(output_arr)):
-                for j in range(0, ch_num):
-                    output_arr[i][2 * j] = output_arr[i][2 * j] + output_arr[i - 1][2 * j]
-
-            df = pd.DataFrame(output_arr)
-            df.columns = ["ch1", "ts1", "ch3", "ts3", "ch4", "ts4", "ch6", "ts6", "ch7", "ts7", "ch9", "ts9", "ch10",
-                          "ts10", "ch11", "ts11", "ch12", "ts12", "ch13", "ts13", "ch14", "ts14", "ch15", "ts15",
-                          "ch16", "ts16", "ch17", "ts17", "ch18", "ts18", "ch19", "ts19", "ch20", "ts20", "ch21",
-                          "ts21", "ch22", "ts22", "ch24", "ts24"]
+            columns = ["ch1", "ts1", "ch3", "ts3", "ch4", "ts4", "ch6", "ts6", "ch7", "ts7", "ch9", "ts9", "ch10",
+                       "ts10", "ch11", "ts11", "ch12", "ts12", "ch13", "ts13", "ch14", "ts14", "ch15", "ts15",
+                       "ch16", "ts16", "ch17", "ts17", "ch18", "ts18", "ch19", "ts19", "ch20", "ts20", "ch21",
+                       "ts21", "ch22", "ts22", "ch24", "ts24"]
+            _err, df = self.decompress_emg_data(arr, ch_num, columns)
+            if _err != ErrorCode.ERR_NO_ERROR:
+                return _err, None
             # df = (df.sub(4096)).div(4096)
             self.logger.debug(f"{__name__}: {len(df)}")
             return ErrorCode.ERR_NO_ERROR, df
@@ -631,29 +914,15 @@ class CeresSensorDataParser(RawSensorDataParser):
             if self.data is None:
                 self.logger.error("Data is None!")
                 return ErrorCode.ERR_BAD_DATA, None
-            start_idx = self.data.find("{")
-            end_idx = self.data.rfind("}")
             ch_num = 8
-            self.logger.debug(f"{start_idx}, {end_idx}")
-            js_obj = json.loads(self.data[start_idx: end_idx + 1])
+            js_obj = self.extract_json_object()
             arr = np.array(js_obj["output"]["adc_data"])
             self.logger.debug(f"arr length {len(arr)}")
-            output_arr = np.reshape(arr, (-1, ch_num*2))
-            base_timestamp = 0
-            # Decompress timestamps
-            for i in range(len(output_arr)):
-                output_arr[i][1] = output_arr[i][1] + base_timestamp
-                base_timestamp = output_arr[i][1]
-                for j in range(1, ch_num):
-                    output_arr[i][2 * j + 1] = output_arr[i][2 * j + 1] + base_timestamp
-            # Decompress channel data
-            for i in range(1, len(output_arr)):
-                for j in range(0, ch_num):
-                    output_arr[i][2 * j] = output_arr[i][2 * j] + output_arr[i - 1][2 * j]
-
-            df = pd.DataFrame(output_arr)
-            df.columns = ["ch1", "ts1", "ch2", "ts2", "ch3", "ts3", "ch5", "ts5", "ch6", "ts6", "ch7", "ts7",
-                          "ch11", "ts11", "ch13", "ts13"]
+            columns = ["ch1", "ts1", "ch2", "ts2", "ch3", "ts3", "ch5", "ts5", "ch6", "ts6", "ch7", "ts7",
+                       "ch11", "ts11", "ch13", "ts13"]
+            _err, df = self.decompress_emg_data(arr, ch_num, columns)
+            if _err != ErrorCode.ERR_NO_ERROR:
+                return _err, None
             df = (df.div(65536)).mul(5)
             self.logger.debug(f"{__name__}: {len(df)}")
             return ErrorCode.ERR_NO_ERROR, df
@@ -663,8 +932,9 @@ class CeresSensorDataParser(RawSensorDataParser):
 
     def convert_emg_data(self):
         try:
-            max_len = max(len(row) for row in self.data)
-            raw_data = np.array([row + [''] * (max_len - len(row)) for row in self.data]).T
+            _rows = self.data_rows()
+            max_len = max(len(row) for row in _rows)
+            raw_data = np.array([row + [''] * (max_len - len(row)) for row in _rows]).T
             df = pd.DataFrame(raw_data[1:], columns=raw_data[0])
             new_columns = list()
             valid_columns = list()
@@ -695,31 +965,17 @@ class GEN2SensorDataParser(RawSensorDataParser):
             if self.data is None:
                 self.logger.error("Data is None!")
                 return ErrorCode.ERR_BAD_DATA, None
-            start_idx = self.data.find("{")
-            end_idx = self.data.rfind("}")
             ch_num = 20
-            self.logger.debug(f"{start_idx}, {end_idx}")
-            js_obj = json.loads(self.data[start_idx: end_idx + 1])
+            js_obj = self.extract_json_object()
             arr = np.array(js_obj["output"]["adc_data"])
             self.logger.debug(f"arr length {len(arr)}")
-            output_arr = np.reshape(arr, (-1, ch_num*2))
-            base_timestamp = 0
-            # Decompress timestamps
-            for i in range(len(output_arr)):
-                output_arr[i][1] = output_arr[i][1] + base_timestamp
-                base_timestamp = output_arr[i][1]
-                for j in range(1, ch_num):
-                    output_arr[i][2 * j + 1] = output_arr[i][2 * j + 1] + base_timestamp
-            # Decompress channel data
-            for i in range(1, len(output_arr)):
-                for j in range(0, ch_num):
-                    output_arr[i][2 * j] = output_arr[i][2 * j] + output_arr[i - 1][2 * j]
-
-            df = pd.DataFrame(output_arr)
-            df.columns = ["ch0", "ts0", "ch1", "ts1", "ch2", "ts2", "ch3", "ts3", "ch4", "ts4", "ch5", "ts5", "ch6",
-                          "ts6", "ch7", "ts7", "ch8", "ts8", "ch9", "ts9", "ch10", "ts10", "ch11", "ts11",
-                          "ch12", "ts12", "ch13", "ts13", "ch14", "ts14", "ch15", "ts15", "ch16", "ts16", "ch17",
-                          "ts17", "ch18", "ts18", "ch19", "ts19"]
+            columns = ["ch0", "ts0", "ch1", "ts1", "ch2", "ts2", "ch3", "ts3", "ch4", "ts4", "ch5", "ts5", "ch6",
+                       "ts6", "ch7", "ts7", "ch8", "ts8", "ch9", "ts9", "ch10", "ts10", "ch11", "ts11",
+                       "ch12", "ts12", "ch13", "ts13", "ch14", "ts14", "ch15", "ts15", "ch16", "ts16", "ch17",
+                       "ts17", "ch18", "ts18", "ch19", "ts19"]
+            _err, df = self.decompress_emg_data(arr, ch_num, columns)
+            if _err != ErrorCode.ERR_NO_ERROR:
+                return _err, None
             self.logger.debug(f"{__name__}: {len(df)}")
             return ErrorCode.ERR_NO_ERROR, df
         except Exception as ex:
@@ -741,9 +997,159 @@ def RawDataParser(project="malibu", **kwarge):
         return MalibuSensorDataParser(**kwarge)
 
 
+# format of the data file by extension, None if not supported
+def data_file_format(_file: str) -> str | None:
+    _ext = os.path.splitext(_file)[1].lower().lstrip(".")
+    return _ext if _ext in DATA_FILE_FORMATS else None
+
+
+# format used to save data, npz instead of feather/parquet if pyarrow is not installed, csv if unknown
+def available_data_format(_format: str) -> str:
+    _format = _format.lower().lstrip(".") if _format else "csv"
+    if _format not in DATA_FILE_FORMATS:
+        return "csv"
+    if _format in ["feather", "parquet"] and pyarrow is None:
+        return "npz"
+    return _format
+
+
+'''
+    save DataFrame to file, the format is decided by the file extension:
+    csv: text, feather/parquet: columnar binary by pyarrow, npz: one numpy array per column, no index
+    if pyarrow is not installed, feather/parquet are saved as npz with the extension changed
+    return the path of the saved file
+'''
+def save_data_file(_df: pd.DataFrame, _target_file: str) -> str:
+    _format = data_file_format(_target_file) or "csv"
+    if available_data_format(_format) != _format:
+        _target_file = os.path.splitext(_target_file)[0] + ".npz"
+        _format = "npz"
+    if _format == "feather":
+        _df.reset_index(drop=True).to_feather(_target_file)
+    elif _format == "parquet":
+        _df.to_parquet(_target_file, index=False)
+    elif _format == "npz":
+        _columns = {NPZ_COLUMNS_KEY: np.array([str(col) for col in _df.columns])}
+        for i, col in enumerate(_df.columns):
+            _arr = _df[col].to_numpy()
+            _columns[f"c{i}"] = _arr.astype(str) if _arr.dtype == object else _arr  # no pickle in the file
+        np.savez(_target_file, **_columns)
+    else:
+        _df.to_csv(_target_file, index=False)
+    return _target_file
+
+
+# load DataFrame from file saved by save_data_file, binary formats are loaded without text parsing
+def load_data_file(_source_file: str) -> pd.DataFrame:
+    _format = data_file_format(_source_file) or "csv"
+    if _format == "feather":
+        return pd.read_feather(_source_file)
+    elif _format == "parquet":
+        return pd.read_parquet(_source_file)
+    elif _format == "npz":
+        with np.load(_source_file, allow_pickle=False) as _npz:
+            _names = _npz[NPZ_COLUMNS_KEY].tolist()
+            return pd.DataFrame({name: _npz[f"c{i}"] for i, name in enumerate(_names)}, copy=False)
+    return pd.read_csv(_source_file, index_col=False)
+
+
+'''
+    extract sensor data of one raw log file with a new parser, it is picklable so can be run in a worker process
+    _project: project name, e.g. malibu, bali
+    _source_file, _sensor, _target_file: same as RawSensorDataParser.extract_sensor_data
+    kwargs: passed to the parser, e.g. RawSensorDataParser.parser_kwargs() of the caller
+'''
+def extract_sensor_file(_project: str, _source_file: str, _sensor: str, _target_file: str = None,
+                        **kwargs) -> (ErrorCode, pd.DataFrame | None):
+    return RawDataParser(_project, **kwargs).extract_sensor_data(_source_file=_source_file, _sensor=_sensor,
+                                                                 _project=_project, _target_file=_target_file)
+
+
+'''
+    decode time of the json document(from the first "{", or "FT> {" if any, to the last "}") in each raw log file
+    with each backend
+    _source_files: raw log files, e.g. bali emg dump, ppg/imu print_samples
+    _repeat: the best of _repeat runs is taken
+'''
+def json_backend_benchmark(_source_files: list, _repeat: int = 3) -> pd.DataFrame:
+    rows = list()
+    for _file in _source_files:
+        with open(_file, 'rb') as _fh:
+            _raw = _fh.read()
+        _start = _raw.find(b"{", max(_raw.find(b"FT> {"), 0))
+        _doc = _raw[_start: _raw.rfind(b"}") + 1].decode(errors='ignore').encode()
+        _mb = len(_doc) / (1 << 20)
+        for name in JsonBackend.available():
+            _backend = JsonBackend(name)
+            _best = None
+            for i in range(_repeat):
+                _start = time.perf_counter()
+                _backend.loads(_doc)
+                _cost = time.perf_counter() - _start
+                _best = _cost if _best is None or _cost < _best else _best
+            rows.append([os.path.basename(_file), name, round(_mb, 3), round(_best * 1000, 1),
+                         round(_best * 1000 / _mb, 1)])
+    return pd.DataFrame(rows, columns=["file", "backend", "MB", "ms", "ms/MB"])
+
+
+# emg parser before the block parser, one regex match and float() per line, kept as the benchmark reference
+def parse_emg_lines(_text: str) -> np.ndarray:
+    values = list()
+    for line in _text.splitlines():
+        if re.match(r'^(\d\.\d{6}\t){8}$', line):
+            values.append([float(val) for val in line.strip().split()])
+    return np.array(values).reshape(-1, 8)
+
+
+# random emg dump of _lines rows of 8 "d.dddddd\t" values, with a command line every 1000 rows
+def make_emg_dump(_lines: int, seed: int = 0) -> str:
+    _rng = np.random.default_rng(seed)
+    _rows = ["".join(f"{val:.6f}\t" for val in row) for row in _rng.uniform(0, 3.3, (_lines, 8))]
+    for i in range(0, _lines, 1000):
+        _rows[i] = "sending cmd: ad469x dump_last_stream emg_adc0@0\n" + _rows[i]
+    return "\n".join(_rows) + "\n"
+
+
+'''
+    parse time of an emg dump by the line parser(parse_emg_lines) and the block parser(extract_emg_data),
+    the two parsers must have the same result
+    _text: emg dump text, make_emg_dump(1000000) if None
+    _repeat: the best of _repeat runs is taken
+'''
+def emg_parser_benchmark(_text: str = None, _repeat: int = 3) -> pd.DataFrame:
+    _text = make_emg_dump(1000000) if _text is None else _text
+    _parsers = {
+        "lines": parse_emg_lines,
+        "block": lambda _data: RawSensorDataParser().extract_sensor_data(_data=_data, _sensor="emg")[1].to_numpy(),
+    }
+    rows = list()
+    _results = dict()
+    for name, _func in _parsers.items():
+        _best = None
+        for i in range(_repeat):
+            _start = time.perf_counter()
+            _results[name] = _func(_text)
+            _cost = time.perf_counter() - _start
+            _best = _cost if _best is None or _cost < _best else _best
+        rows.append([name, len(_results[name]), round(_best * 1000, 1),
+                     round(len(_results[name]) / _best / 10 ** 6, 3)])
+    if not np.array_equal(_results["lines"], _results["block"]):
+        raise ValueError("emg parsers have different results")
+    _df = pd.DataFrame(rows, columns=["parser", "lines", "ms", "Mlines/s"])
+    _df["speedup"] = (_df["ms"].iloc[0] / _df["ms"]).round(1)
+    return _df
+
+
 # example
 if __name__ == '__main__':
     import sys
+    if sys.argv[1] == "json_benchmark":  # python data_parser_utility.py json_benchmark a.log b.log ...
+        print(json_backend_benchmark(sys.argv[2:]).to_string(index=False))
+        sys.exit(0)
+    if sys.argv[1] == "emg_benchmark":  # python data_parser_utility.py emg_benchmark [lines]
+        _lines = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+        print(emg_parser_benchmark(make_emg_dump(_lines)).to_string(index=False))
+        sys.exit(0)
     rdp = RawDataParser(project="bali")
     # err, df_data = rdp.convert_ceres_test_data(sys.argv[1])
     # if err == ErrorCode.ERR_NO_ERROR:
@@ -1,11 +1,11 @@
 # -*- coding: UTF-8 -*-
 import numpy as np
 import pandas as pd
+import scipy.fft
 import scipy.fftpack
 from scipy import signal, stats
-from scipy.signal import butter, lfilter, filtfilt
+from scipy.signal import butter, sosfilt, sosfiltfilt
 import matplotlib
-import matplotlib.pyplot as plt
 from matplotlib.table import Table
 from matplotlib.widgets import CheckButtons
 import matplotlib.patches as patches
@@ -19,6 +19,43 @@ import time
 import os
 import copy
 import datetime
+import functools
+import hashlib
+import json
+from data_cache_utility import file_digest
+from data_parser_utility import load_data_file
+
+
+#
+# matplotlib.pyplot imported on the first drawing call, analysis without drawing (data_analysis_utility) does not
+# load pyplot and its gui backend
+#
+class LazyPyplot:
+    def __getattr__(self, name):
+        import matplotlib.pyplot
+        return getattr(matplotlib.pyplot, name)
+
+
+plt = LazyPyplot()
+
+
+FILTER_CACHE_SIZE = 64  # max designed filters kept in memory
+# float32 halves the memory of signals and spectra, dB values stay within 0.001 dB of float64 for bins
+# no more than 80 dB below the spectrum peak (0.05 dB at 100 dB), sums and means are still done in float64
+PRECISIONS = {"float32": np.float32, "float64": np.float64}
+# fft length of n samples, pow2: next power of 2, fast: scipy.fft.next_fast_len, exact: n
+FFT_SIZE_POLICIES = ["pow2", "fast", "exact"]
+# decimated sample rate is at least 2 x 1.5 x the highest frequency of interest, resample_poly's filter is flat
+# below about 0.8 of the new nyquist frequency
+DECIMATE_MARGIN = 1.5
+TONE_BLOCK_SIZE = 4096  # samples per block of the tone dft, its cos/sin table is block x bins
+# stages of the emg analysis memoized in stage_cache, each of them by its own inputs, the filter stage converts,
+# trims and filters the selected channels in one buffer in place, so only the filtered signals are kept,
+# drawing and saving files run every time
+PIPELINE_STAGES = ["decode", "filter", "spectrum", "metrics"]
+RESULT_CACHE_VERSION = 2  # increase it when calculate_emg_data results change, so old cached results are not used
+RESULT_CACHE_COMPRESSED = ["target_freq", "target_sig"]  # spectra of the results are saved compressed
+WELCH_BLOCK_SEGMENTS = 32  # welch segments calculated at once, memory is about channels x 32 x nperseg
 
 
 class ErrorCode(IntEnum):
@@ -30,6 +67,43 @@ class ErrorCode(IntEnum):
     ERR_BAD_UNKNOWN = -255,
 
 
+'''
+    butterworth filter coefficients, designed once for the same parameters
+    return: (b, a, sos), read only arrays shared by all callers
+'''
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def design_butter_filter(order: int, cutoff: float, btype: str, sample_rate: float) -> tuple:
+    nyq = 0.5 * sample_rate  # Nyquist frequency
+    b, a = butter(order, cutoff / nyq, btype=btype)
+    sos = butter(order, cutoff / nyq, btype=btype, output='sos')
+    for val in (b, a, sos):
+        val.setflags(write=False)
+    return b, a, sos
+
+
+'''
+    notch filter coefficients, designed once for the same parameters
+    return: (b, a, sos), read only arrays shared by all callers
+'''
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def design_notch_filter(freq: float, qvalue: float, sample_rate: float) -> tuple:
+    b, a = signal.iirnotch(w0=freq, Q=qvalue, fs=sample_rate)
+    sos = signal.tf2sos(b, a)
+    for val in (b, a, sos):
+        val.setflags(write=False)
+    return b, a, sos
+
+
+'''
+    zoom fft of the band [0, width] Hz of signals with the given length, created once for the same parameters,
+    band [f1, f1 + width] is the zoom fft of the signal shifted down by f1, so bands of the same width share it
+    return: signal.ZoomFFT, shared by all callers
+'''
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def design_zoom_fft(length: int, width: float, points: int, sample_rate: float) -> signal.ZoomFFT:
+    return signal.ZoomFFT(length, [0.0, width], points, fs=sample_rate, endpoint=True)
+
+
 class VisualizeParameters:
     def __init__(self):
         self.project = "malibu"
@@ -46,10 +120,25 @@ class VisualizeParameters:
         self.freq_scale = dict()  # {"x": {"start": 0, "end": 0}, "y": {"start": 0, "end": 0}}
         self.summary_scale = dict()  # {"x": {"start": 0, "end": 0}, "y": {"start": 0, "end": 0}}
         self.search_peak = 0
+        self.harmonics = [2, 3, 4, 5]  # harmonics of the peak frequency to search
+        self.harmonic_refine = 0  # use the max within +-k bins around each harmonic, 0: the nearest bin
+        # stats only, with search_peak set the fft only measures the peak and harmonic bins, no full spectrum,
+        # the chart only has their markers, no ui control, set by the tone_only kwarg of FlowControl or by analyze()
+        self.tone_only = False
+        # sub-bin peak and harmonics by a zoom fft of the signal around each of them, fft only
+        self.peak_zoom = 0  # points of each zoom fft, 0: no refinement
+        self.peak_zoom_span = 1.0  # half width of each zoom band, in bins of the fft
+        # fft of the signals decimated to just above twice freq_scale x end (and the searched harmonics),
+        # statistics of the time domain still use the full rate signals
+        self.decimate = False
         self.freq_convert_type = "fft"
+        self.psd_segment = None  # {"nperseg": 4096, "overlap": 0.5, "window": "hann"}, None: one segment of whole data
         self.plot_name = None
         self.show = True
         self.gain = 1.0
+        self.precision = "float64"  # float type of signals and spectra, one of PRECISIONS
+        self.fft_size_policy = "pow2"  # one of FFT_SIZE_POLICIES
+        self.fft_workers = -1  # threads of scipy.fft, -1: all cpu cores
 
         self.canvas = None
 
@@ -59,6 +148,16 @@ class DataVisualization:
         self.parameters = VisualizeParameters()
         self.logger = kwargs["logger"] if 'logger' in kwargs and kwargs["logger"] is not None else logging.getLogger()
         self.figure_canvas = kwargs['canvas'] if 'canvas' in kwargs else None
+        # ArrayCache(or DataCache) of the emg results of each channel, None: always calculate
+        self.result_cache = kwargs['result_cache'] if 'result_cache' in kwargs else None
+        # StageCache of the pipeline stage outputs in this session, None: always calculate
+        self.stage_cache = kwargs['stage_cache'] if 'stage_cache' in kwargs else None
+        self.stage_keys = dict()  # {stage: key of its last output}
+        self.column_digests = dict()  # {channel: digest of raw data}
+        self.fft_size = 0  # length of the last fft or welch segment, saved to the statistics file
+        self.decimation = 1  # decimation factor of the signals in the last fft, see decimate_signals
+        self.tone_harmonics = None  # harmonic_data measured by do_tone_convertion
+        self.zoom_data = None  # [[(freq, amp), ...channels] of peak, harmonics...] refined by refine_peak_points
 
         self.process_func = {
             "emg": self.visualize_emg_data,
@@ -69,6 +168,16 @@ class DataVisualization:
             "bti": self.visualize_bti_data,
             "others": self.visualize_other_data,
         }
+        # results of each sensor without drawing, for analyze_data
+        self.calculate_func = {
+            "emg": self.calculate_emg_data,
+            "ppg": self.calculate_ppg_data,
+            "imu": self.calculate_imu_data,
+            "alt": self.calculate_alt_data,
+            "mag": self.calculate_mag_data,
+            "bti": self.calculate_bti_data,
+            "others": self.calculate_other_sensors_data,
+        }
 
         self.bad_channel = list()
         self.target_channels = list()
@@ -86,7 +195,37 @@ class DataVisualization:
         self.legend_rows = 32  # 16
 
     def visualize_data(self, params: VisualizeParameters):
+        _err_code = self.prepare_data(params)
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code
+        return self.process_func[self.parameters.sensor.lower()]()
+
+    '''
+        results of params without any figure, table or file, the harmonics of emg are searched as for the figure,
+        with the same stage_cache a later visualize_data of the same params draws without calculating again
+        return: (ErrorCode, target_data)
+    '''
+    def analyze_data(self, params: VisualizeParameters) -> (ErrorCode, dict):
+        _err_code = self.prepare_data(params)
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, None
+        if self.parameters.sensor.lower() not in self.calculate_func:
+            self.logger.error(f"sensor is not supported: {self.parameters.sensor}")
+            return ErrorCode.ERR_BAD_ARGS, None
+        _err_code, self.target_data = self.calculate_func[self.parameters.sensor.lower()]()
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, None
+        if self.parameters.sensor.lower() == "emg":
+            self.search_harmonic_points()
+            self.refine_peak_points(self.parameters.freq_convert_type)
+        return ErrorCode.ERR_NO_ERROR, self.target_data
+
+    # reset the results of the last run and load the data of params
+    def prepare_data(self, params: VisualizeParameters) -> ErrorCode:
         self.parameters = params
+        self.decimation = 1
+        self.stage_keys = dict()
+        self.column_digests = dict()
         self.bad_channel = list()
         self.target_channels = list()
         self.main_lines = dict()  # save {ax:[lines]) for click event on the line
@@ -104,10 +243,14 @@ class DataVisualization:
 
         if self.parameters.data_file is not None:
             try:
-                self.parameters.df_data = pd.read_csv(self.parameters.data_file)
+                _inputs = [file_digest(self.parameters.data_file, True)]
             except Exception as ex:
                 self.logger.error(f"Exception: {str(ex)}")
                 return ErrorCode.ERR_BAD_FILE
+            _err_code, _df_data = self.run_stage("decode", _inputs, self.read_data_file)
+            if _err_code != ErrorCode.ERR_NO_ERROR:
+                return ErrorCode.ERR_BAD_FILE
+            self.parameters.df_data = _df_data
 
         if self.parameters.df_data is None:
             return ErrorCode.ERR_BAD_DATA
@@ -116,8 +259,34 @@ class DataVisualization:
         if not len(self.parameters.selected_columns):
             tmp = self.parameters.df_data.columns.dropna().tolist()
             self.parameters.selected_columns = [val for val in tmp if val.lower() not in ["timestamp"]]
+        return ErrorCode.ERR_NO_ERROR
 
-        return self.process_func[self.parameters.sensor.lower()]()
+    def read_data_file(self) -> (ErrorCode, pd.DataFrame):
+        try:
+            return ErrorCode.ERR_NO_ERROR, load_data_file(self.parameters.data_file)
+        except Exception as ex:
+            self.logger.error(f"Exception: {str(ex)}")
+            return ErrorCode.ERR_BAD_FILE, None
+
+    '''
+        output of a pipeline stage, from stage_cache if the stage has run with the same inputs,
+        the key is saved to stage_keys, so downstream stages use it as their input
+        _stage: one of PIPELINE_STAGES
+        _inputs: values the output depends on, keys of upstream stages included
+        _func: calculate the output, return (ErrorCode, output)
+    '''
+    def run_stage(self, _stage: str, _inputs: list, _func) -> (ErrorCode, object):
+        _canonical = json.dumps([_stage, _inputs], sort_keys=True, default=str)  # same inputs, same text
+        _key = hashlib.blake2b(_canonical.encode(), digest_size=16).hexdigest()
+        self.stage_keys[_stage] = _key
+        if self.stage_cache is not None:
+            _output = self.stage_cache.get(_stage, _key)
+            if _output is not None:
+                return ErrorCode.ERR_NO_ERROR, _output
+        _err_code, _output = _func()
+        if _err_code == ErrorCode.ERR_NO_ERROR and self.stage_cache is not None:
+            self.stage_cache.put(_stage, _key, _output)
+        return _err_code, _output
 
     def initialize_figure(self, rows: int = 2, cols: int = 2) -> ErrorCode:
         try:
@@ -220,8 +389,10 @@ class DataVisualization:
             self.logger.debug("draw emg frequency domain chart ...")
             plt.subplot(layout["rows"], layout["cols"], layout["index"])
             self.search_harmonic_points()
+            self.refine_peak_points(stype)
             for i in range(0, len(self.target_channels)):
-                self.draw_freq_domain_line(layout, stype, i)
+                if self.tone_harmonics is None:  # tone mode only has the measured bins, no spectrum line
+                    self.draw_freq_domain_line(layout, stype, i)
                 # mark peak freq with solid 'o' and '|'
                 self.draw_peak_freq_marker(i)
                 # mark harmonics with 'x'
@@ -279,17 +450,83 @@ class DataVisualization:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
             return ErrorCode.ERR_BAD_UNKNOWN
 
+    '''
+        index of the nearest bin of each target frequency, frequency bins are uniform so it is calculated
+        instead of scanned, the neighbours are compared to get the same bin as argmin(abs(freq - target))
+        _freq: frequency axis
+        _target: array of frequencies, any shape
+    '''
+    def locate_frequency_index(self, _freq, _target) -> np.ndarray:
+        _last = len(_freq) - 1
+        _step = _freq[1] - _freq[0] if _last > 0 else 1.0
+        _target = np.where(np.isfinite(_target), _target, _freq[0])
+        _index = np.clip(np.rint((_target - _freq[0]) / _step), 0, _last).astype(np.int64)
+        _cand = np.clip(_index[..., np.newaxis] + np.array([-1, 0, 1]), 0, _last)
+        _best = np.argmin(np.abs(_freq[_cand] - _target[..., np.newaxis]), axis=-1)
+        return np.take_along_axis(_cand, _best[..., np.newaxis], axis=-1)[..., 0]
+
     def search_harmonic_points(self):
-        harmonics = [2, 3, 4, 5]
+        if self.tone_harmonics is not None:  # already measured, target_freq only has the measured bins
+            self.harmonic_data = copy.deepcopy(self.tone_harmonics)
+            return
+        harmonics = np.asarray(self.parameters.harmonics, dtype=np.float64)
         self.harmonic_data = [[(0, 0)] * len(self.target_channels) for _ in range(len(harmonics))]
+        if not len(self.target_channels) or not len(harmonics):
+            return
+        _freq = self.target_data["target_freq"][0]
+        _peak = np.asarray(self.target_data["target_freq_peak"][:len(self.target_channels)], dtype=np.float64)
+        # (harmonics, channels) bins of all harmonics at once
+        _target = harmonics[:, np.newaxis] * _peak[np.newaxis, :]
+        _index = self.locate_frequency_index(_freq, _target)
+        _k = int(self.parameters.harmonic_refine)
         for i in range(0, len(self.target_channels)):
-            for k, h in enumerate(harmonics):
-                harmonic_index = np.argmin(np.abs(
-                    self.target_data["target_freq"][i] - h * self.target_data["target_freq_peak"][i]))
-                harmonic_freq = self.target_data["target_freq"][i][harmonic_index]
-                harmonic_sig = self.target_data["target_sig"][i][harmonic_index]
+            _freq_i = self.target_data["target_freq"][i]
+            _sig_i = self.target_data["target_sig"][i]
+            _idx = _index[:, i]
+            if len(_freq_i) != len(_freq):
+                _idx = self.locate_frequency_index(_freq_i, _target[:, i])
+            if _k > 0:
+                _window = np.clip(_idx[:, np.newaxis] + np.arange(-_k, _k + 1), 0, len(_sig_i) - 1)
+                _idx = np.take_along_axis(_window, np.argmax(_sig_i[_window], axis=-1)[:, np.newaxis], axis=-1)[:, 0]
+            for k in range(len(harmonics)):
                 # harmonic_coords.append((harmonic_freq, harmonic_dbv))
-                self.harmonic_data[k][i] = (harmonic_freq, harmonic_sig)
+                self.harmonic_data[k][i] = (_freq_i[_idx[k]], _sig_i[_idx[k]])
+
+    '''
+        zoom fft (chirp-z) of the signal in a narrow band around the peak and each harmonic of every channel,
+        the max of the band gives the sub-bin frequency and amplitude, in the same dBV scale as the fft,
+        channels with the same band are transformed at once
+    '''
+    def refine_peak_points(self, stype: str = "fft"):
+        self.zoom_data = None
+        if self.parameters.peak_zoom <= 0 or stype == "psd" or not len(self.target_channels) or self.fft_size <= 0:
+            return
+        _m = max(int(self.parameters.peak_zoom), 2)
+        _half = float(self.parameters.peak_zoom_span) * self.get_spectrum_rate() / self.fft_size
+        _nyquist = self.parameters.sample_rate / 2
+        _sig = np.asarray(self.target_data["sig"])
+        _time = np.arange(_sig.shape[-1]) / self.parameters.sample_rate
+        _centers = np.asarray(self.target_data["target_freq_peak"][:len(self.target_channels)], dtype=np.float64)
+        harmonics = [1] + list(self.parameters.harmonics)
+        self.zoom_data = [[(0, 0)] * len(self.target_channels) for _ in range(len(harmonics))]
+        for k, h in enumerate(harmonics):
+            _bands = dict()  # (start, end): channels
+            for i, val in enumerate(_centers):
+                # harmonics are around h x the refined peak, the coarse peak error grows with h
+                _target = val if k == 0 else h * self.zoom_data[0][i][0]
+                _band = (max(float(_target) - _half, 0.0), min(float(_target) + _half, _nyquist))
+                _bands.setdefault(_band, []).append(i)
+            for (_f1, _f2), _channels in _bands.items():
+                # same width of the bands, which are not cut by 0 or nyquist, same zoom fft
+                _width = round(_f2 - _f1, 9)
+                _zoom = design_zoom_fft(_sig.shape[-1], _width, _m, float(self.parameters.sample_rate))
+                _shifted = _sig[_channels] * np.exp(-2j * np.pi * _f1 * _time) if _f1 > 0 else _sig[_channels]
+                _amp = np.abs(_zoom(_shifted, axis=-1))
+                _best = np.argmax(_amp, axis=-1)
+                _freq = _f1 + np.linspace(0, _width, _m)
+                for j, i in enumerate(_channels):
+                    self.zoom_data[k][i] = (_freq[_best[j]], 20 * np.log10(_amp[j, _best[j]]))
+        self.logger.info(f"zoom fft: {_m} points in +-{_half:.4f} Hz of the peak and {len(harmonics) - 1} harmonics")
 
     def draw_peak_freq_marker(self, ch: int = 0):
         if self.parameters.sensor.lower() in ["emg", "ppg"]:
@@ -312,7 +549,7 @@ class DataVisualization:
 
     def draw_harmonic_marker(self, ch: int = 0):
         # mark harmonics with 'x'
-        for k, h in enumerate([2, 3, 4, 5]):
+        for k, h in enumerate(self.parameters.harmonics):
             _line, = plt.plot(self.harmonic_data[k][ch][0], self.harmonic_data[k][ch][1], 'x',
                               color=self.line_colors[self.target_channels[ch]],
                               label=f'Harmonic {h} ({self.harmonic_data[k][ch][0]:.2f},'
@@ -417,20 +654,19 @@ class DataVisualization:
             data_array = [["Signal"] + self.target_channels,
                           ["Peak.freq"] + ["{:.2f}".format(val) for val in self.target_data["target_freq_peak"]],
                           ["Peak.amp"] + [txt_format.format(val) for val in self.target_data["target_sig_peak"]],
-                          ["H2.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[0]],
-                          ["H2.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[0]],
-                          ["H3.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[1]],
-                          ["H3.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[1]],
-                          ["H4.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[2]],
-                          ["H4.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[2]],
-                          ["H5.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[3]],
-                          ["H5.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[3]],
                           ]
+            for k, h in enumerate(self.parameters.harmonics):
+                data_array.append([f"H{h}.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[k]])
+                data_array.append([f"H{h}.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[k]])
+            if self.zoom_data is not None:  # sub-bin values of the zoom fft
+                for k, name in enumerate(["Peak"] + [f"H{h}" for h in self.parameters.harmonics]):
+                    data_array.append([f"{name}.zoom.freq"] + ["{:.4f}".format(val) for val, _ in self.zoom_data[k]])
+                    data_array.append([f"{name}.zoom.amp"] + [txt_format.format(val) for _, val in self.zoom_data[k]])
             # if stype == "psd":
             #     thd_power = [0.0 for _ in range(0, len(self.target_channels))]
             #     thd = [0.0 for _ in range(0, len(self.target_channels))]
             #     for i in range(len(self.target_channels)):
-            #         for j in range(4):
+            #         for j in range(len(self.harmonic_data)):
             #             thd_power[i] += self.harmonic_data[j][i][1]
             #         thd[i] = np.sqrt(thd_power[i]) / np.sqrt(self.target_data["target_sig_peak"][i]) \
             #             if self.target_data["target_sig_peak"][i] > 0 else 0.0
@@ -443,7 +679,21 @@ class DataVisualization:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
             return ErrorCode.ERR_BAD_UNKNOWN, None
 
+    '''
+        export stage, files are saved on every run, even for the same analysis, the files of the previous run
+        may be deleted or moved, or the log path may be changed
+    '''
     def save_statistic_and_picture(self, t1: np.array = None, t2: np.array = None) -> ErrorCode:
+        _err_code, _files = self.export_statistic_and_picture(t1, t2)
+        if _err_code == ErrorCode.ERR_NO_ERROR:
+            self.logger.info(f"statistics and picture: {_files}")
+        return _err_code
+
+    '''
+        save the tables to csv and the figure to png in the log path
+        return: [csv file, png file], csv file is None if there is no table
+    '''
+    def export_statistic_and_picture(self, t1: np.array = None, t2: np.array = None) -> (ErrorCode, list):
         try:
             df = pd.DataFrame(t1[1:], columns=t1[0]) if t1 is not None else None
             df1 = pd.DataFrame(t2[1:], columns=t2[0]) if t2 is not None else None
@@ -451,19 +701,25 @@ class DataVisualization:
                 df = pd.concat([df, df1[df1.columns[1:]]], axis=1)
             elif df1 is not None:
                 df = df1
+            # fft length and decimation factor of each channel, to reproduce the result
+            for key, name in [["fft_size", "FFT size"], ["decimation", "Decimation"]]:
+                if df is not None and key in self.target_data and len(self.target_data[key]) == len(df):
+                    df[name] = self.target_data[key]
             _postfix = time.strftime("%Y%m%d_%H%M%S", time.localtime())
             # _png_file = f"{self.parameters.plot_name}_{_postfix}.png"
             _png_file = os.path.join(self.logger.log_path, f"{self.parameters.plot_name}_{_postfix}.png")
+            _csv_file = None
             if df is not None:
-                df.to_csv(os.path.join(self.logger.log_path, f"{self.parameters.plot_name}_{_postfix}.csv"), index=False)
+                _csv_file = os.path.join(self.logger.log_path, f"{self.parameters.plot_name}_{_postfix}.csv")
+                df.to_csv(_csv_file, index=False)
                 self.logger.debug(
                     f"save data to: {self.parameters.plot_name}_{_postfix}.csv")
             plt.savefig(_png_file)
             self.logger.debug(f"save picture to: {self.parameters.plot_name}_{_postfix}.png")
-            return ErrorCode.ERR_NO_ERROR
+            return ErrorCode.ERR_NO_ERROR, [_csv_file, _png_file]
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
-            return ErrorCode.ERR_BAD_UNKNOWN
+            return ErrorCode.ERR_BAD_UNKNOWN, None
 
     def visualize_emg_data(self):
         try:
@@ -616,56 +872,132 @@ class DataVisualization:
         self.parameters.df_data = self.parameters.df_data.div(self.parameters.gain)
         return self.parameters.df_data
 
-    def calculate_emg_data(self):
+    def get_precision(self):
+        return PRECISIONS[self.parameters.precision] if self.parameters.precision in PRECISIONS else np.float64
+
+    '''
+        emg results of the selected channels, channels found in result_cache are not calculated again,
+        the others are calculated together and saved to the cache
+    '''
+    def calculate_emg_data(self) -> (ErrorCode, dict):
+        channels = list(self.parameters.selected_columns)
+        self.column_digests = dict()
+        if self.result_cache is None or not self.result_cache.enable or not len(channels):
+            return self.calculate_emg_channels(channels)
+        cache_keys = {channel: self.get_result_cache_key(channel) for channel in channels}
+        results = dict()
+        for channel in channels:
+            _cached = self.result_cache.get(cache_keys[channel])
+            if _cached is not None:
+                results[channel] = _cached
+        _missing = [channel for channel in channels if channel not in results]
+        self.logger.info(f"emg results from cache: {len(results)}, to calculate: {len(_missing)}")
+        if len(_missing):
+            _err_code, _data = self.calculate_emg_channels(_missing)
+            if _err_code != ErrorCode.ERR_NO_ERROR or len(self.bad_channel):
+                return _err_code, _data
+            for i, channel in enumerate(_data["channel"]):
+                results[channel] = {key: _data[key][i] for key in _data if key != "time"}  # time is not saved
+                results[channel]["tone_harmonics"] = [row[i] for row in self.tone_harmonics] \
+                    if self.tone_harmonics is not None else None
+                self.result_cache.put(cache_keys[channel], results[channel])
+        self.result_cache.flush()  # index of the new results, once for all channels
+        self.bad_channel = list()
+        self.zoom_data = None
+        _data = {key: [results[channel][key] for channel in channels]
+                 for key in results[channels[0]] if key != "tone_harmonics"}
+        time = np.arange(len(_data["sig"][0])) / self.parameters.sample_rate
+        _data["time"] = [time for _ in channels]
+        self.fft_size = _data["fft_size"][-1]
+        self.decimation = results[channels[-1]]["decimation"]
+        self.tone_harmonics = None
+        if all([results[channel]["tone_harmonics"] is not None for channel in channels]):
+            self.tone_harmonics = [[results[channel]["tone_harmonics"][k] for channel in channels]
+                                   for k in range(len(results[channels[0]]["tone_harmonics"]))]
+        self.target_channels = copy.deepcopy(_data["channel"])
+        return ErrorCode.ERR_NO_ERROR, _data
+
+    '''
+        key of the emg results of one channel: its raw data, the parameters used by calculate_emg_channels
+        and the class, as subclasses calculate psd differently
+    '''
+    def get_result_cache_key(self, channel: str) -> str:
+        _params = {key: getattr(self.parameters, key) for key in
+                   ["data_type", "data_drop", "sample_rate", "gain", "high_pass_filter", "low_pass_filter",
+                    "notch_filter",
+                    "freq_convert_type", "psd_segment", "search_peak", "harmonics", "harmonic_refine", "tone_only",
+                    "precision", "fft_size_policy", "decimate"]}
+        if self.parameters.decimate and self.parameters.freq_scale is not None:
+            _params["freq_scale"] = self.parameters.freq_scale.get("x")
+        _canonical = json.dumps(_params, sort_keys=True, default=str)  # same parameters, same text
+        return self.result_cache.make_key(RESULT_CACHE_VERSION, type(self).__name__, channel,
+                                          self.get_column_digest(channel), _canonical)
+
+    '''
+        digest of the raw data of one channel, with its type and length, calculated once in a run
+    '''
+    def get_column_digest(self, channel: str) -> str:
+        if channel not in self.column_digests:
+            _column = np.ascontiguousarray(self.parameters.df_data[channel].to_numpy())
+            _digest = hashlib.blake2b(_column.view(np.uint8) if _column.dtype != object else
+                                      repr(_column.tolist()).encode(), digest_size=16).hexdigest()
+            self.column_digests[channel] = f"{_column.dtype}:{len(_column)}:{_digest}"
+        return self.column_digests[channel]
+
+    def calculate_emg_channels(self, channels: list) -> (ErrorCode, dict):
         self.bad_channel = list()
         keys = ["channel", "time", "sig", "total_rms", "avg_p2p", "cycle", "cycle_time",
-                "max", "min", "target_freq", "target_freq_peak", "target_sig", "target_sig_peak", "bias", "target_rms"]
+                "max", "min", "target_freq", "target_freq_peak", "target_sig", "target_sig_peak", "bias", "target_rms",
+                "fft_size", "decimation", "spectrum_rate"]
         _data = {key: [] for key in keys}
 
-        self.convert_emg_adc_data()
-        drops = self.parameters.data_drop
-        for channel in self.parameters.selected_columns:
-            _length = len(self.parameters.df_data[channel])
-            _start = int(drops[0]) if 0 < int(drops[0]) < _length-1 else 0
-            _end = _length-int(drops[1]) if 0 < int(drops[1]) < (_length-_start) else _length-1
-            voltage = self.parameters.df_data[channel].iloc[_start:_end]
-
-            dc_bias = np.mean(voltage)
-            # Remove DC bias from waveform
-            ac_signal = voltage - dc_bias
-            _err_code, ac_signal = self.filter_signals(ac_signal)
-            if _err_code != ErrorCode.ERR_NO_ERROR:
-                return _err_code, _data
-            # Create time axis
-            time = np.arange(len(voltage)) / self.parameters.sample_rate
-            # Calculate FFT of AC signal
-            if len(ac_signal) == 0:
+        self.tone_harmonics = None
+        self.zoom_data = None
+        # filter: adc conversion, drop window, dc bias removal, high pass, low pass and notch filters
+        _inputs = [type(self).__name__, self.parameters.data_type, self.parameters.gain, self.parameters.precision,
+                   channels, [self.get_column_digest(channel) for channel in channels], self.parameters.data_drop,
+                   self.parameters.sample_rate, self.parameters.high_pass_filter, self.parameters.low_pass_filter,
+                   self.parameters.notch_filter]
+        _err_code, _output = self.run_stage("filter", _inputs, lambda: self.filter_emg_channels(channels))
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, _data
+        ac_signal, dc_bias = _output
+        # Create time axis
+        time = np.arange(ac_signal.shape[-1]) / self.parameters.sample_rate
+        if ac_signal.shape[-1] == 0:
+            for channel in channels:
                 self.logger.error(f"bad channel data: {channel}")
                 self.bad_channel.append(channel)
-                continue
-            if self.parameters.freq_convert_type == "psd":
-                _err_code, (target_freq, target_sig, target_freq_peak,
-                            target_sig_peak, target_rms) = self.do_psd_convertion(ac_signal)
-            else:
-                _err_code, (target_freq, target_sig, target_freq_peak,
-                            target_sig_peak) = self.do_fft_convertion(ac_signal)
-                target_rms = 0
-            if _err_code != ErrorCode.ERR_NO_ERROR:
-                continue
-            self.logger.info(f"peak:{target_freq_peak},{target_sig_peak}")
-            # Find cycle time and max/min values in each cycle
-            cycle_time = 1 / target_freq_peak
-            num_cycles = int(len(ac_signal) / (cycle_time * self.parameters.sample_rate))
-            max_vals = np.zeros(num_cycles)
-            min_vals = np.zeros(num_cycles)
-            for i in range(num_cycles):
-                cycle_start = int(i * cycle_time * self.parameters.sample_rate)
-                cycle_end = int((i + 1) * cycle_time * self.parameters.sample_rate)
-                cycle_vals = ac_signal[cycle_start:cycle_end]
-                max_val = np.max(cycle_vals)
-                min_val = np.min(cycle_vals)
-                max_vals[i] = max_val
-                min_vals[i] = min_val
+            return ErrorCode.ERR_NO_ERROR, _data
+        # spectrum: FFT/PSD of AC signal, one call for all channels
+        _inputs = [self.stage_keys["filter"]] + [getattr(self.parameters, key) for key in
+                                                 ["sample_rate", "freq_convert_type", "psd_segment", "search_peak",
+                                                  "harmonics", "harmonic_refine", "tone_only", "fft_size_policy",
+                                                  "decimate"]]
+        if self.parameters.decimate and self.parameters.freq_scale is not None:
+            _inputs.append(self.parameters.freq_scale.get("x"))
+        _err_code, _output = self.run_stage("spectrum", _inputs, lambda: self.calculate_emg_spectrum(ac_signal))
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, _data
+        _result, self.fft_size, self.decimation, self.tone_harmonics = _output
+        if self.parameters.freq_convert_type == "psd":
+            target_freq, target_sig, target_freq_peak, target_sig_peak, target_rms = _result
+        else:
+            target_freq, target_sig, target_freq_peak, target_sig_peak = _result
+            target_rms = np.zeros(len(channels))
+        # metrics: RMS level, cycle time and max/min values in each cycle
+        _inputs = [self.stage_keys["filter"], self.stage_keys["spectrum"]]
+        _err_code, _output = self.run_stage("metrics", _inputs,
+                                            lambda: self.calculate_emg_metrics(ac_signal, target_freq_peak))
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, _data
+        rms_val, cycle_times, all_max_vals, all_min_vals = _output
+        for i, channel in enumerate(channels):
+            self.logger.info(f"peak:{target_freq_peak[i]},{target_sig_peak[i]}")
+            cycle_time = cycle_times[i]
+            max_vals = all_max_vals[i]
+            min_vals = all_min_vals[i]
+            num_cycles = len(max_vals)
 
             # Calculate peak-to-peak value for each cycle
             peak_to_peak_vals = max_vals - min_vals
@@ -673,26 +1005,139 @@ class DataVisualization:
             # Compute average peak-to-peak value
             avg_peak_to_peak_val = np.mean(peak_to_peak_vals)
 
-            # Calculate RMS level value
-            rms_val = np.sqrt(np.mean(np.array(ac_signal) ** 2))
             _data["channel"].append(channel)
             _data["time"].append(time)
-            _data["sig"].append(ac_signal)
-            _data["total_rms"].append(rms_val)
+            _data["sig"].append(ac_signal[i])
+            _data["total_rms"].append(rms_val[i])
             _data["avg_p2p"].append(avg_peak_to_peak_val)
             _data["cycle"].append(num_cycles)
             _data["cycle_time"].append(cycle_time)
             _data["max"].append(max_vals)
             _data["min"].append(min_vals)
             _data["target_freq"].append(target_freq)
-            _data["target_freq_peak"].append(target_freq_peak)
-            _data["target_sig"].append(target_sig)
-            _data["target_sig_peak"].append(target_sig_peak)
-            _data["bias"].append(dc_bias)
-            _data["target_rms"].append(target_rms)
-            self.target_channels = copy.deepcopy(_data["channel"])
+            _data["target_freq_peak"].append(target_freq_peak[i])
+            _data["target_sig"].append(target_sig[i])
+            _data["target_sig_peak"].append(target_sig_peak[i])
+            _data["bias"].append(dc_bias[i])
+            _data["target_rms"].append(target_rms[i])
+            _data["fft_size"].append(self.fft_size)
+            _data["decimation"].append(self.decimation)
+            _data["spectrum_rate"].append(self.get_spectrum_rate())
+        self.target_channels = copy.deepcopy(_data["channel"])
+        if self.stage_cache is not None:
+            self.logger.debug(f"stage cache [hits, misses]: {self.stage_cache.statistics()}")
         return ErrorCode.ERR_NO_ERROR, _data
 
+    '''
+        filter stage, convert the selected columns, copy their data_drop window into one buffer without dc bias and
+        filter it in place, the converted columns and the trimmed buffer are not memoized, so no copy is needed
+        return: (filtered (channels, samples) buffer, dc bias of each channel)
+    '''
+    def filter_emg_channels(self, channels: list) -> (ErrorCode, tuple):
+        _err_code, df_data = self.convert_emg_channels(channels)
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, None
+        _err_code, (ac_signal, dc_bias) = self.trim_emg_channels(df_data, channels)
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, None
+        _err_code, ac_signal = self.filter_signals(ac_signal, True)
+        return _err_code, (ac_signal, dc_bias)
+
+    '''
+        adc code of the selected columns to voltage in the float type of precision
+        return: DataFrame of the selected columns
+    '''
+    def convert_emg_channels(self, channels: list) -> (ErrorCode, pd.DataFrame):
+        try:
+            self.parameters.df_data = self.parameters.df_data[channels]
+            _dtype = self.get_precision()
+            if _dtype != np.float64:  # adc conversion keeps the float type of the columns
+                self.parameters.df_data = self.parameters.df_data.astype({channel: _dtype for channel in channels})
+            return ErrorCode.ERR_NO_ERROR, self.convert_emg_adc_data()
+        except Exception as ex:
+            self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+            return ErrorCode.ERR_BAD_DATA, None
+
+    '''
+        copy the data_drop window of each column into one (channels, samples) buffer and
+        remove the dc bias of each channel
+        return: (buffer, dc bias of each channel)
+    '''
+    def trim_emg_channels(self, df_data: pd.DataFrame, channels: list) -> (ErrorCode, tuple):
+        drops = self.parameters.data_drop
+        _length = len(df_data)
+        _start = int(drops[0]) if 0 < int(drops[0]) < _length-1 else 0
+        _end = _length-int(drops[1]) if 0 < int(drops[1]) < (_length-_start) else _length-1
+        _window = slice(_start, _end)
+        # all channels share the same rows, bias removal and filters work in place on the buffer
+        ac_signal = np.empty((len(channels), len(range(_length)[_window])), dtype=self.get_precision())
+        for i, channel in enumerate(channels):
+            ac_signal[i] = df_data[channel].to_numpy()[_window]
+
+        dc_bias = self.calculate_bias(ac_signal)
+        # Remove DC bias from waveform
+        ac_signal -= dc_bias[:, np.newaxis]
+        return ErrorCode.ERR_NO_ERROR, (ac_signal, dc_bias)
+
+    '''
+        spectrum stage, fft (or tone mode) of the decimated signals, or psd
+        return: (result of do_xxx_convertion, fft_size, decimation, tone_harmonics)
+    '''
+    def calculate_emg_spectrum(self, ac_signal) -> (ErrorCode, tuple):
+        self.decimation = 1
+        if self.parameters.freq_convert_type == "psd":
+            _err_code, _result = self.do_psd_convertion(ac_signal)
+        else:
+            _spectrum_signal = self.decimate_signals(ac_signal) if self.parameters.decimate else ac_signal
+            _err_code = ErrorCode.ERR_BAD_ARGS
+            if self.parameters.tone_only and self.parameters.search_peak > 0:
+                _err_code, _result = self.do_tone_convertion(_spectrum_signal)
+            if _err_code == ErrorCode.ERR_BAD_ARGS:  # no tone mode or search_peak out of the spectrum
+                _err_code, _result = self.do_fft_convertion(_spectrum_signal)
+        return _err_code, (_result, self.fft_size, self.decimation, self.tone_harmonics)
+
+    '''
+        metrics stage, RMS level, cycle time and max/min values in each cycle of all channels
+        return: (rms, cycle times, list of max arrays, list of min arrays)
+    '''
+    def calculate_emg_metrics(self, ac_signal, target_freq_peak) -> (ErrorCode, tuple):
+        # Calculate RMS level value, einsum needs no squared copy of the signal
+        rms_val = np.sqrt(np.einsum('ij,ij->i', ac_signal, ac_signal, dtype=np.float64) / ac_signal.shape[-1])
+        # Find cycle time and max/min values in each cycle
+        with np.errstate(divide='ignore'):
+            cycle_times = 1 / np.asarray(target_freq_peak, dtype=np.float64)
+        all_max_vals, all_min_vals = self.calculate_cycle_peaks(ac_signal, cycle_times)
+        return ErrorCode.ERR_NO_ERROR, (rms_val, cycle_times, all_max_vals, all_min_vals)
+
+    '''
+        max and min values of each cycle for all channels, cycle i is [int(i*T*fs), int((i+1)*T*fs))
+        _sig: (channels, samples) array
+        _cycle_times: cycle time T of each channel
+        return: list of max arrays, list of min arrays, one array per channel
+    '''
+    def calculate_cycle_peaks(self, _sig, _cycle_times) -> (list, list):
+        _length = _sig.shape[-1]
+        _flat = _sig.reshape(-1)
+        _starts = list()
+        _ranges = list()  # [first, last) cycle of each channel in the reduced arrays
+        _pos = 0
+        for i, cycle_time in enumerate(_cycle_times):
+            num_cycles = int(_length / (cycle_time * self.parameters.sample_rate))
+            _bounds = (np.arange(num_cycles + 1) * cycle_time * self.parameters.sample_rate).astype(np.int64) \
+                if num_cycles > 0 else np.zeros(1, dtype=np.int64)
+            # the extra start cuts off the tail after the last full cycle, its result is dropped
+            _starts.append(_bounds + i * _length)
+            _ranges.append((_pos, _pos + num_cycles))
+            _pos += num_cycles + 1
+        _starts = np.concatenate(_starts)
+        if _starts[-1] >= len(_flat):
+            _starts = _starts[:-1]
+        if not len(_starts):
+            return [np.zeros(0) for _ in _ranges], [np.zeros(0) for _ in _ranges]
+        _max = np.maximum.reduceat(_flat, _starts).astype(np.float64)
+        _min = np.minimum.reduceat(_flat, _starts).astype(np.float64)
+        return [_max[a:b] for a, b in _ranges], [_min[a:b] for a, b in _ranges]
+
     def calculate_ppg_data(self):
         return self.calculate_other_sensors_data(True)
 
@@ -713,29 +1158,34 @@ class DataVisualization:
 
     def calculate_other_sensors_data(self, b_snr=False):
         keys = ["channel", "avg", "sig", "noise", "time", "sum_vector", "snr",
-                "target_freq", "target_freq_peak", "target_sig", "target_sig_peak"]
+                "target_freq", "target_freq_peak", "target_sig", "target_sig_peak", "fft_size"]
         _data = {key: [] for key in keys}
         self.bad_channel = []
         drops = self.parameters.data_drop
         for channel in self.parameters.selected_columns:
             try:
-                _length = len(self.parameters.df_data[channel])
+                _column = self.parameters.df_data[channel].to_numpy()
+                _length = len(_column)
                 _start = int(drops[0]) if 0 < int(drops[0]) < _length - 1 else 0
                 _end = _length - int(drops[1]) if 0 < int(drops[1]) < (_length - _start) else _length - 1
-                _sig = self.parameters.df_data[channel].iloc[_start:_end]
+                _sig = _column[_start:_end]  # view of the column, no copy
 
-                avg = np.mean(_sig)
-                _sig_ac = _sig - avg
-                _err_code, _sig_ac = self.filter_signals(_sig_ac)
+                avg = self.calculate_bias(_sig)
+                # the only signal sized buffer, filters work in place on it
+                _sig_ac = np.subtract(_sig, avg, dtype=self.get_precision())
+                _err_code, _sig_ac = self.filter_signals(_sig_ac, True)
                 if _err_code != ErrorCode.ERR_NO_ERROR:
                     return _err_code, _data
 
                 noise = np.std(_sig_ac)
+                if np.isnan(noise):
+                    noise = np.nanstd(_sig_ac)
                 self.logger.debug(f"{avg}, {noise}")
                 timex = np.linspace(0, len(_sig_ac) / self.parameters.sample_rate, len(_sig_ac))
-                sum_vector = np.array(_sig_ac)
+                sum_vector = _sig_ac
 
-                ffts = 2.0 / len(sum_vector) * abs(scipy.fft.fft(sum_vector))
+                # half spectrum of the real signal is enough, only bins below nyquist are used
+                ffts = 2.0 / len(sum_vector) * np.abs(scipy.fft.rfft(sum_vector, workers=self.parameters.fft_workers))
                 freqs = scipy.fftpack.fftfreq(len(timex), timex[1] - timex[0])
                 half_len = int(len(freqs)/2)
                 target_sig = ffts[1:half_len]
@@ -766,6 +1216,7 @@ class DataVisualization:
                 _data["target_freq_peak"].append(peak_freq)
                 _data["target_sig"].append(target_sig)
                 _data["target_sig_peak"].append(peak_sig)
+                _data["fft_size"].append(len(sum_vector))
                 if b_snr:
                     snr = 20 * math.log10(avg / noise)
                     _data["snr"].append(snr)
@@ -777,6 +1228,21 @@ class DataVisualization:
                 continue
         return ErrorCode.ERR_NO_ERROR, _data
 
+    '''
+        mean of the last axis without NaN, nanmean is only used for the rows with NaN since it copies the data
+        _sig: one signal or (channels, samples) array
+    '''
+    def calculate_bias(self, _sig):
+        if _sig.shape[-1] == 0:
+            return np.zeros(_sig.shape[:-1])[()]
+        _bias = np.mean(_sig, axis=-1, dtype=np.float64)
+        _nan = np.isnan(_bias)
+        if np.any(_nan):
+            if _sig.ndim == 1:
+                return np.nanmean(_sig, dtype=np.float64)
+            _bias[_nan] = np.nanmean(_sig[_nan], axis=-1, dtype=np.float64)
+        return _bias
+
     def scale_frequency_domain_axis(self):
         try:
             if self.parameters.freq_scale is not None:
@@ -791,34 +1257,139 @@ class DataVisualization:
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
 
+    '''
+        anti-alias decimate all channels by an integer factor, so the sample rate is just above twice the
+        upper frequency of freq_scale x (or the searched harmonics if they are higher), the factor is saved
+        to decimation, 1 if the window is too wide to decimate
+        _sig: (channels, samples) array
+    '''
+    def decimate_signals(self, _sig) -> np.ndarray:
+        self.decimation = 1
+        _scale = self.parameters.freq_scale["x"] if self.parameters.freq_scale is not None and \
+            "x" in self.parameters.freq_scale and self.parameters.freq_scale["x"] is not None else None
+        if _scale is None or float(_scale["end"]) <= 0:  # no upper frequency, full band
+            return _sig
+        _upper = float(_scale["end"])
+        if self.parameters.search_peak > 0 and len(self.parameters.harmonics):
+            _upper = max(_upper, float(self.parameters.search_peak) * max(self.parameters.harmonics))
+        _factor = int(self.parameters.sample_rate / (2 * DECIMATE_MARGIN * _upper))
+        if _factor < 2 or _sig.shape[-1] < 2 * _factor:
+            return _sig
+        self.decimation = _factor
+        self.logger.info(f"decimate signals by {_factor}: {self.parameters.sample_rate} -> "
+                         f"{self.parameters.sample_rate / _factor} Hz")
+        return signal.resample_poly(_sig, 1, _factor, axis=-1)
+
+    '''
+        sample rate of the signals in the spectrum, lower than sample_rate if they are decimated
+    '''
+    def get_spectrum_rate(self) -> float:
+        return self.parameters.sample_rate / self.decimation
+
+    def get_fft_size(self, _length: int) -> int:
+        if self.parameters.fft_size_policy == "exact":
+            return _length
+        elif self.parameters.fft_size_policy == "fast":
+            return scipy.fft.next_fast_len(_length, real=True)
+        else:
+            return 2 ** int(np.ceil(np.log2(_length)))
+
+    '''
+        _sig: one signal, or (channels, samples) array, the spectrum is calculated along the last axis
+        return: target_freq is shared by all channels, others have one value/row per channel
+    '''
     def do_fft_convertion(self, _sig) -> (ErrorCode, tuple):
         try:
-            if len(_sig) == 0:
+            _sig = np.asarray(_sig)
+            if _sig.shape[-1] == 0:
                 self.logger.error(f"signal is empty!!")
                 return ErrorCode.ERR_BAD_DATA, None
             else:
-                fft_size = 2 ** int(np.ceil(np.log2(len(_sig))))
-                target_freq = np.fft.rfftfreq(fft_size, d=1 / self.parameters.sample_rate)
-                fft_amplitude = np.abs(np.fft.rfft(_sig, fft_size))
-                target_sig = 20 * np.log10(fft_amplitude / 1)  # Convert to dBV
-                # if self.parameters.search_peak > 0 and np.isin(self.parameters.search_peak, target_freq):
-                if 0 < self.parameters.search_peak <= np.argmax(target_freq):
-                    idx = np.argmin(np.abs(target_freq - self.parameters.search_peak))
-                    if 0< idx < len(target_sig):
-                        _start = idx-1
-                    elif idx == 0:
-                        _start = 0
-                    else:
-                        _start = idx-2
-                    temp = [target_sig[_start], target_sig[_start+1], target_sig[_start+2]]
-                    _idx = np.argmax(temp)
-                    peak_sig = temp[_idx]
-                    peak_freq = target_freq[_idx+_start]
-                else:
-                    idx = np.argmax(fft_amplitude)
-                    peak_freq = target_freq[idx]
-                    peak_sig = target_sig[idx]
+                fft_size = self.get_fft_size(_sig.shape[-1])
+                self.fft_size = fft_size
+                target_freq = np.fft.rfftfreq(fft_size, d=1 / self.get_spectrum_rate())
+                target_sig = np.abs(scipy.fft.rfft(_sig, fft_size, axis=-1, workers=self.parameters.fft_workers))
+                np.log10(target_sig, out=target_sig)
+                target_sig *= 20  # Convert to dBV
+                if self.decimation > 1:  # same amplitude as the fft of the full rate signal
+                    target_sig += 20 * np.log10(self.decimation)
+                peak_freq, peak_sig = self.search_peak_value(target_freq, target_sig)
+
+            return ErrorCode.ERR_NO_ERROR, (target_freq, target_sig, peak_freq, peak_sig)
+        except Exception as ex:
+            self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+            return ErrorCode.ERR_BAD_UNKNOWN, None
 
+    '''
+        dft of a few bins of the zero padded fft, all channels at once, cost is samples x bins instead of a full fft,
+        the cos/sin table of one block is reused for every block with a phase shift of the block start
+        _sig: (channels, samples) array
+        _bins: bin index of the fft_size points fft
+        return: (channels, bins) complex array, same values as the fft on these bins
+    '''
+    def calculate_dft_bins(self, _sig, _bins, fft_size: int) -> np.ndarray:
+        _bins = np.asarray(_bins, dtype=np.int64)
+        _block = min(TONE_BLOCK_SIZE, _sig.shape[-1])
+        # integer phase index keeps the phase exact on long signals
+        _phase = (np.outer(np.arange(_block, dtype=np.int64), _bins) % fft_size) * (-2 * np.pi / fft_size)
+        _cos, _sin = np.cos(_phase), np.sin(_phase)
+        _result = np.zeros((_sig.shape[0], len(_bins)), dtype=np.complex128)
+        for _first in range(0, _sig.shape[-1], _block):
+            _part = _sig[:, _first:_first + _block]
+            _length = _part.shape[-1]
+            _shift = np.exp(1j * (_first * _bins % fft_size) * (-2 * np.pi / fft_size))
+            _result += (_part @ _cos[:_length] + 1j * (_part @ _sin[:_length])) * _shift
+        return _result
+
+    '''
+        tone mode of do_fft_convertion, only the bins around search_peak and the harmonics of each possible peak
+        are measured, the peak and harmonic values are the same as do_fft_convertion + search_harmonic_points
+        _sig: (channels, samples) array
+        return: (target_freq, target_sig, peak_freq, peak_sig) as do_fft_convertion, target_freq/target_sig only
+                have the measured bins, harmonics are saved to tone_harmonics
+    '''
+    def do_tone_convertion(self, _sig) -> (ErrorCode, tuple):
+        try:
+            _sig = np.asarray(_sig)
+            if _sig.shape[-1] == 0:
+                self.logger.error(f"signal is empty!!")
+                return ErrorCode.ERR_BAD_DATA, None
+            fft_size = self.get_fft_size(_sig.shape[-1])
+            self.fft_size = fft_size
+            freq_axis = np.fft.rfftfreq(fft_size, d=1 / self.get_spectrum_rate())
+            _last = len(freq_axis) - 1
+            if not 0 < self.parameters.search_peak <= _last:  # same range as search_peak_value
+                self.logger.info("search peak is out of the spectrum, use the full fft")
+                return ErrorCode.ERR_BAD_ARGS, None
+            # same 3 bins around search_peak as search_peak_value
+            idx = int(self.locate_frequency_index(freq_axis, np.array(float(self.parameters.search_peak))))
+            _start = idx - 1 if idx > 0 else 0
+            peak_bins = np.arange(_start, min(_start + 3, _last + 1))
+            harmonics = np.asarray(self.parameters.harmonics, dtype=np.float64)
+            _k = int(self.parameters.harmonic_refine)
+            # (peak bins, harmonics) nearest bin of each harmonic of each possible peak, +-k bins around it
+            harmonic_bins = self.locate_frequency_index(freq_axis, freq_axis[peak_bins][:, np.newaxis] * harmonics)
+            _window = np.clip(harmonic_bins[..., np.newaxis] + np.arange(-_k, _k + 1), 0, _last)
+            _bins = np.unique(np.concatenate([peak_bins, _window.reshape(-1)]))
+            self.logger.info(f"tone mode: {len(_bins)} bins of {fft_size} points fft")
+
+            target_freq = freq_axis[_bins]
+            target_sig = np.abs(self.calculate_dft_bins(_sig, _bins, fft_size))
+            np.log10(target_sig, out=target_sig)
+            target_sig *= 20  # Convert to dBV
+            if self.decimation > 1:  # same amplitude as the fft of the full rate signal
+                target_sig += 20 * np.log10(self.decimation)
+            _pos = np.searchsorted(_bins, peak_bins)
+            _best = np.argmax(target_sig[:, _pos], axis=-1)
+            peak_freq = target_freq[_pos[_best]]
+            peak_sig = target_sig[np.arange(len(_best)), _pos[_best]]
+
+            self.tone_harmonics = [[(0, 0)] * len(_best) for _ in range(len(harmonics))]
+            for i, val in enumerate(_best):
+                _cols = np.searchsorted(_bins, _window[val])  # (harmonics, 2k+1)
+                _h = np.take_along_axis(_cols, np.argmax(target_sig[i][_cols], axis=-1)[:, np.newaxis], axis=-1)
+                for k in range(len(harmonics)):
+                    self.tone_harmonics[k][i] = (target_freq[_h[k, 0]], target_sig[i][_h[k, 0]])
             return ErrorCode.ERR_NO_ERROR, (target_freq, target_sig, peak_freq, peak_sig)
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
@@ -826,7 +1397,8 @@ class DataVisualization:
 
     def do_psd_convertion(self, _sig) -> (ErrorCode, tuple):
         try:
-            if len(_sig) == 0:
+            _sig = np.asarray(_sig)
+            if _sig.shape[-1] == 0:
                 self.logger.error(f"signal is empty!!")
                 return ErrorCode.ERR_BAD_DATA, None
             else:
@@ -834,124 +1406,150 @@ class DataVisualization:
                 # target_rms = np.sqrt(
                 #     sum(target_sig[1:int(self.parameters.sample_rate / 2) + 1] * (target_freq[1] - target_freq[0])))
 
-                target_freq, psd = signal.welch(_sig, fs=self.parameters.sample_rate, nperseg=len(_sig))
+                target_freq, psd = self.do_welch(_sig)
                 target_sig = 20 * np.log10(np.sqrt(psd))  # convert to dB/Hz
                 # target_sig = 10 * np.log10(psd)
-                target_rms = np.sqrt(
-                    sum(psd[1:int(self.parameters.sample_rate / 2) + 1] * (target_freq[1] - target_freq[0])))
-                # if self.parameters.search_peak > 0 and np.isin(self.parameters.search_peak, target_freq):
-                if 0 < self.parameters.search_peak <= np.argmax(target_freq):
-                    idx = np.argmin(np.abs(target_freq - self.parameters.search_peak))
-                    if 0< idx < len(target_sig):
-                        _start = idx-1
-                    elif idx == 0:
-                        _start = 0
-                    else:
-                        _start = idx-2
-                    temp = [target_sig[_start], target_sig[_start+1], target_sig[_start+2]]
-                    _idx = np.argmax(temp)
-                    peak_sig = temp[_idx]
-                    peak_freq = target_freq[_idx+_start]
-                else:
-                    idx = np.argmax(target_sig)
-                    peak_freq = target_freq[idx]
-                    peak_sig = target_sig[idx]
+                target_rms = np.sqrt(np.sum(
+                    psd[..., 1:int(self.parameters.sample_rate / 2) + 1] * (target_freq[1] - target_freq[0]), axis=-1,
+                    dtype=np.float64))
+                peak_freq, peak_sig = self.search_peak_value(target_freq, target_sig)
 
             return ErrorCode.ERR_NO_ERROR, (target_freq, target_sig, peak_freq, peak_sig, target_rms)
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
             return ErrorCode.ERR_BAD_UNKNOWN, None
 
-    def filter_signals(self, _sig: pd.DataFrame) -> (int, pd.DataFrame):
-        new_sig = copy.deepcopy(_sig)
-        _err_code, new_sig = self.do_high_pass_filter(new_sig)
-        if _err_code != ErrorCode.ERR_NO_ERROR:
-            return _err_code, _sig
-        _err_code, new_sig = self.do_low_pass_filter(new_sig)
-        if _err_code != ErrorCode.ERR_NO_ERROR:
-            return _err_code, _sig
-        _err_code, new_sig = self.do_notch_filter(new_sig)
-        if _err_code != ErrorCode.ERR_NO_ERROR:
-            return _err_code, _sig
-
-        return _err_code, new_sig
-
-    def do_notch_filter(self, _sig):
-        try:
-            if self.parameters.notch_filter is None or not len(self.parameters.notch_filter):
-                self.logger.info(f"notch filer parameter is empty, do nothing")
-                return
-            self.logger.info(f"do_notch_filter")
-            _new_sig = _sig
-            for idx, f in self.parameters.notch_filter.items():
-                self.logger.debug(f"notch parameters: {idx}, {f}")
-                if f is not None and f != {"freq": 0, "qvalue": 0}:
-                    self.logger.info(f"notch parameters: {f}")
-                    try:
-                        b1, a1 = signal.iirnotch(w0=float(f['freq']), Q=float(f['qvalue']),
-                                                 fs=self.parameters.sample_rate)
-                    except Exception as ex:
-                        self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
-                        return ErrorCode.ERR_BAD_ARGS, _sig
-                    _new_sig = signal.lfilter(b1, a1, _new_sig)
-            return ErrorCode.ERR_NO_ERROR, _new_sig
-        except Exception as ex:
-            self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
-            return ErrorCode.ERR_BAD_UNKNOWN, _sig
-
-    def do_high_pass_filter(self, sig_list, axis=-1):
-        try:
-            self.logger.info(f"do_high_pass_filter ...")
-            if self.parameters.high_pass_filter is None or self.parameters.high_pass_filter["type"] == "":
-                self.logger.info(f"bad high pass filter parameters, do nothing!")
-                return ErrorCode.ERR_NO_ERROR, sig_list
-            order = int(self.parameters.high_pass_filter["order"])
-            freq1 = float(self.parameters.high_pass_filter["freq"])
-            sig = np.asarray(sig_list, dtype=np.float32)
-            sig = sig - sig[0]
-            nyq = 0.5 * self.parameters.sample_rate  # Nyquist frequency
-            high = freq1 / nyq
-            b, a = butter(order, high, btype='high')
-            # apply filter
-            if self.parameters.high_pass_filter["type"] == 'lfilter':
-                sig_filt = lfilter(b, a, sig, axis=axis)
-            elif self.parameters.high_pass_filter["type"] == 'filtfilt':
-                sig_filt = filtfilt(b, a, sig, axis=axis)
+    '''
+        welch psd along the last axis of one signal or (channels, samples) array,
+        without psd_segment it is one periodogram of the whole signal, otherwise the segments are averaged
+        WELCH_BLOCK_SEGMENTS at a time, so memory scales with the segment length instead of the signal length
+        return: (target_freq, psd)
+    '''
+    def do_welch(self, _sig) -> (np.ndarray, np.ndarray):
+        _length = _sig.shape[-1]
+        _segment = self.parameters.psd_segment
+        if _segment is None or "nperseg" not in _segment or not _segment["nperseg"]:
+            self.fft_size = _length
+            return signal.welch(_sig, fs=self.parameters.sample_rate, nperseg=_length, axis=-1)
+        nperseg = min(int(_segment["nperseg"]), _length)
+        overlap = float(_segment["overlap"]) if "overlap" in _segment and _segment["overlap"] is not None else 0.5
+        noverlap = min(max(int(nperseg * overlap), 0), nperseg - 1)
+        window = _segment["window"] if "window" in _segment and _segment["window"] else "hann"
+        _step = nperseg - noverlap
+        self.fft_size = nperseg
+        num_segments = (_length - nperseg) // _step + 1
+        self.logger.info(f"welch: nperseg={nperseg}, noverlap={noverlap}, window={window}, segments={num_segments}")
+        psd_sum = None
+        for _first in range(0, num_segments, WELCH_BLOCK_SEGMENTS):
+            _count = min(WELCH_BLOCK_SEGMENTS, num_segments - _first)
+            _block = _sig[..., _first * _step: _first * _step + (_count - 1) * _step + nperseg]
+            target_freq, psd = signal.welch(_block, fs=self.parameters.sample_rate, window=window,
+                                            nperseg=nperseg, noverlap=noverlap, axis=-1)
+            if psd_sum is None:
+                psd_sum = psd * _count
             else:
-                self.logger.error(f"filter type is invalid, do nothing")
-                return ErrorCode.ERR_BAD_ARGS, sig_list
-
-            return ErrorCode.ERR_NO_ERROR, sig_filt
+                psd_sum += psd * _count
+        return target_freq, psd_sum / num_segments
+
+    '''
+        peak of each spectrum row, around search_peak if it is set, otherwise the max of the whole row
+        target_freq: frequency axis, shared by all rows
+        target_sig: one spectrum or (channels, bins) array
+    '''
+    def search_peak_value(self, target_freq, target_sig) -> (np.ndarray, np.ndarray):
+        if 0 < self.parameters.search_peak <= np.argmax(target_freq):
+            idx = np.argmin(np.abs(target_freq - self.parameters.search_peak))
+            if 0 < idx < target_sig.shape[-1]:
+                _start = idx-1
+            elif idx == 0:
+                _start = 0
+            else:
+                _start = idx-2
+            peak_index = _start + np.argmax(target_sig[..., _start:_start+3], axis=-1)
+        else:
+            peak_index = np.argmax(target_sig, axis=-1)
+        peak_sig = np.take_along_axis(target_sig, np.expand_dims(peak_index, -1), axis=-1)[..., 0]
+        return target_freq[peak_index], peak_sig[()]
+
+    '''
+        compile the enabled high pass, low pass and notch filters to second-order-sections,
+        consecutive stages of the same type (lfilter/filtfilt) are stacked to one chain, except a filtfilt stage
+        which needs zero_start, filtfilt output doesn't start from 0, so the stage must see the previous output,
+        the offset removed by zero_start passes the low pass filter, stacking would change the whole signal
+        return: [[type, sos, zero_start], ...] in high pass, low pass, notch order, empty if no filter is enabled,
+                zero_start: move the signal to start from 0 before the chain, as the high/low pass filters do
+    '''
+    def build_filter_chain(self) -> (ErrorCode, list):
+        try:
+            _stages = list()
+            for btype, _filter in [["high", self.parameters.high_pass_filter], ["low", self.parameters.low_pass_filter]]:
+                if _filter is None or _filter["type"] == "":
+                    continue
+                if _filter["type"] not in ["lfilter", "filtfilt"]:
+                    self.logger.error(f"filter type is invalid: {_filter['type']}")
+                    return ErrorCode.ERR_BAD_ARGS, []
+                _freq = float(_filter["freq"]) if btype == "high" else int(_filter["freq"])
+                _, _, _sos = design_butter_filter(int(_filter["order"]), _freq, btype, self.parameters.sample_rate)
+                _stages.append([_filter["type"], _sos, True])
+            if self.parameters.notch_filter is not None:
+                for idx, f in self.parameters.notch_filter.items():
+                    if f is not None and f != {"freq": 0, "qvalue": 0}:
+                        try:
+                            _, _, _sos = design_notch_filter(float(f['freq']), float(f['qvalue']),
+                                                             self.parameters.sample_rate)
+                        except Exception as ex:
+                            self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+                            return ErrorCode.ERR_BAD_ARGS, []
+                        _stages.append(["lfilter", _sos, False])
+            _chain = list()
+            for _type, _sos, _zero_start in _stages:
+                # lfilter output of a signal starting from 0 also starts from 0, zero_start of the stage is a no-op
+                if len(_chain) and _chain[-1][0] == _type and (_type == "lfilter" or not _zero_start):
+                    _chain[-1][1] = np.vstack([_chain[-1][1], _sos])
+                else:
+                    _chain.append([_type, np.array(_sos), _zero_start])  # sosfilt needs a writable copy
+            return ErrorCode.ERR_NO_ERROR, _chain
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
-            return ErrorCode.ERR_BAD_UNKNOWN, sig_list
-
-    def do_low_pass_filter(self, sig_list, axis=-1):
+            return ErrorCode.ERR_BAD_UNKNOWN, []
+
+    '''
+        apply the filter chain to one signal or a (channels, samples) array along the last axis
+        _inplace: _sig is a writable float array, the result is written back to it row by row,
+                  only one row of temporary memory is used, sosfilt/sosfiltfilt of the whole array would need
+                  2 to 4 temporary arrays of its size, the emg filter stage always filters its own buffer in place,
+                  stage_cache keeps that buffer, not a copy of it
+        return: filtered array, or _sig itself if no filter is enabled
+    '''
+    def filter_signals(self, _sig: pd.DataFrame, _inplace: bool = False) -> (int, pd.DataFrame):
+        _err_code, _chain = self.build_filter_chain()
+        if _err_code != ErrorCode.ERR_NO_ERROR:
+            return _err_code, _sig
+        if not len(_chain):
+            self.logger.info("no filter is enabled, do nothing")
+            return ErrorCode.ERR_NO_ERROR, _sig
         try:
-            self.logger.info(f"do_low_pass_filter ...")
-            if self.parameters.low_pass_filter is None or self.parameters.low_pass_filter["type"] == "":
-                self.logger.info(f"bad low pass filter parameters, do nothing!")
-                return ErrorCode.ERR_NO_ERROR, sig_list
-            order = int(self.parameters.low_pass_filter["order"])
-            freq1 = int(self.parameters.low_pass_filter["freq"])
-            sig = np.asarray(sig_list, dtype=np.float32)
-            sig = sig - sig[0]
-            nyq = 0.5 * self.parameters.sample_rate  # Nyquist frequency
-            high = freq1 / nyq
-            b, a = butter(order, high, btype='low')
-            # apply filter
-            if self.parameters.low_pass_filter["type"] == 'lfilter':
-                sig_filt = lfilter(b, a, sig, axis=axis)
-            elif self.parameters.low_pass_filter["type"] == 'filtfilt':
-                sig_filt = filtfilt(b, a, sig, axis=axis)
-            else:
-                self.logger.error(f"filter type is invalid, do nothing")
-                return ErrorCode.ERR_BAD_ARGS, sig_list
-
-            return ErrorCode.ERR_NO_ERROR, sig_filt
+            self.logger.info(f"filter chain: {[[_type, len(_sos)] for _type, _sos, _ in _chain]}")
+            _func = {"filtfilt": sosfiltfilt, "lfilter": sosfilt}
+            if _inplace:
+                _rows = _sig.reshape(-1, _sig.shape[-1])  # view of the buffer
+                for _type, _sos, _zero_start in _chain:
+                    if _zero_start:
+                        _rows -= _rows[:, :1].copy()  # less step response at the beginning
+                    for i in range(len(_rows)):
+                        _rows[i] = _func[_type](_sos, _rows[i])
+                return ErrorCode.ERR_NO_ERROR, _sig
+            _dtype = self.get_precision()
+            new_sig = np.asarray(_sig, dtype=_dtype)
+            for _type, _sos, _zero_start in _chain:
+                if _zero_start:
+                    new_sig = new_sig - new_sig[..., :1]  # less step response at the beginning
+                # the float64 sos makes a float64 output, back to the float type of precision
+                new_sig = _func[_type](_sos, new_sig, axis=-1).astype(_dtype, copy=False)
+            return ErrorCode.ERR_NO_ERROR, new_sig
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
-            return ErrorCode.ERR_BAD_UNKNOWN, sig_list
+            return ErrorCode.ERR_BAD_UNKNOWN, _sig
 
     def on_legend_click(self, event):
         if event.button != 3:  #  1: left key, 2: middle key, 3: right key
@@ -1357,20 +1955,19 @@ class GEN2DataVisualization(DataVisualization):
             data_array = [["Signal"] + self.target_channels,
                           ["Peak.freq"] + ["{:.2f}".format(val) for val in self.target_data["target_freq_peak"]],
                           ["Peak.amp"] + [txt_format.format(val) for val in self.target_data["target_sig_peak"]],
-                          ["H2.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[0]],
-                          ["H2.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[0]],
-                          ["H3.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[1]],
-                          ["H3.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[1]],
-                          ["H4.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[2]],
-                          ["H4.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[2]],
-                          ["H5.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[3]],
-                          ["H5.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[3]],
                           ]
+            for k, h in enumerate(self.parameters.harmonics):
+                data_array.append([f"H{h}.freq"] + ["{:.2f}".format(val) for val, _ in self.harmonic_data[k]])
+                data_array.append([f"H{h}.amp"] + [txt_format.format(val) for _, val in self.harmonic_data[k]])
+            if self.zoom_data is not None:  # sub-bin values of the zoom fft
+                for k, name in enumerate(["Peak"] + [f"H{h}" for h in self.parameters.harmonics]):
+                    data_array.append([f"{name}.zoom.freq"] + ["{:.4f}".format(val) for val, _ in self.zoom_data[k]])
+                    data_array.append([f"{name}.zoom.amp"] + [txt_format.format(val) for _, val in self.zoom_data[k]])
             if stype == "psd":
                 thd_power = [0.0 for _ in range(0, len(self.target_channels))]
                 thd = [0.0 for _ in range(0, len(self.target_channels))]
                 for i in range(len(self.target_channels)):
-                    for j in range(4):
+                    for j in range(len(self.harmonic_data)):
                         thd_power[i] += self.harmonic_data[j][i][1]
                     thd[i] = np.sqrt(thd_power[i]) / np.sqrt(self.target_data["target_sig_peak"][i]) \
                         if self.target_data["target_sig_peak"][i] > 0 else 0.0
@@ -1415,35 +2012,21 @@ class GEN2DataVisualization(DataVisualization):
 
     def do_psd_convertion(self, _sig) -> (ErrorCode, tuple):
         try:
-            if len(_sig) == 0:
+            _sig = np.asarray(_sig)
+            if _sig.shape[-1] == 0:
                 self.logger.error(f"signal is empty!!")
                 return ErrorCode.ERR_BAD_DATA, None
             else:
-                target_freq, target_sig = signal.welch(_sig, fs=self.parameters.sample_rate, nperseg=len(_sig))
-                target_rms = np.sqrt(
-                    sum(target_sig[1:int(self.parameters.sample_rate / 2) + 1] * (target_freq[1] - target_freq[0])))
+                target_freq, target_sig = self.do_welch(_sig)
+                target_rms = np.sqrt(np.sum(
+                    target_sig[..., 1:int(self.parameters.sample_rate / 2) + 1] * (target_freq[1] - target_freq[0]),
+                    axis=-1, dtype=np.float64))
 
                 # target_freq, psd = signal.welch(_sig, fs=self.parameters.sample_rate, nperseg=len(_sig))
                 # target_sig = 20 * np.log10(np.sqrt(psd))  # convert to dB/Hz
                 # target_rms = np.sqrt(
                 #     sum(psd[1:int(self.parameters.sample_rate / 2) + 1] * (target_freq[1] - target_freq[0])))
-                # if self.parameters.search_peak > 0 and np.isin(self.parameters.search_peak, target_freq):
-                if 0 < self.parameters.search_peak <= np.argmax(target_freq):
-                    idx = np.argmin(np.abs(target_freq - self.parameters.search_peak))
-                    if 0< idx < len(target_sig):
-                        _start = idx-1
-                    elif idx == 0:
-                        _start = 0
-                    else:
-                        _start = idx-2
-                    temp = [target_sig[_start], target_sig[_start+1], target_sig[_start+2]]
-                    _idx = np.argmax(temp)
-                    peak_sig = temp[_idx]
-                    peak_freq = target_freq[_idx+_start]
-                else:
-                    idx = np.argmax(target_sig)
-                    peak_freq = target_freq[idx]
-                    peak_sig = target_sig[idx]
+                peak_freq, peak_sig = self.search_peak_value(target_freq, target_sig)
 
             return ErrorCode.ERR_NO_ERROR, (target_freq, target_sig, peak_freq, peak_sig, target_rms)
         except Exception as ex:
@@ -1467,8 +2050,8 @@ class SummaryDataVisualization:
         # ToDo:: review which columns should be ignored
         self.ignore_columns = ["sn", "start", "end", "timestamp", "serial number", "result"]
 
-        cmaps = plt.colormaps['tab20']
-        cmaps_c = plt.colormaps['tab20b']
+        cmaps = matplotlib.colormaps['tab20']
+        cmaps_c = matplotlib.colormaps['tab20b']
         self.colors = [cmaps(i % 19) for i in range(20)] + [cmaps_c(i % 19) for i in range(20)]
 
     def visualize_data(self, params: VisualizeParameters) -> ErrorCode:
@@ -1497,7 +2080,7 @@ class SummaryDataVisualization:
 
         if self.params.data_file is not None:
             try:
-                self.params.df_data = pd.read_csv(self.params.data_file)
+                self.params.df_data = load_data_file(self.params.data_file)
                 self.params.df_data = self.params.df_data.iloc[:, 3:]
             except Exception as ex:
                 self.logger.error(f"Exception: {str(ex)}")
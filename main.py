@@ -5,6 +5,7 @@ from ui_flow_control import FlowControl
 from my_logger import *
 import sys
 import os
+import multiprocessing
 
 VERSION = "v0.5.322"
 tag = "2025/11/07 12:00"
@@ -23,6 +24,7 @@ class MyApp(QMainWindow):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # for process pool in the packaged executable
     app = QApplication([])
     app.setStyle("Fusion")
     _level = 'info' if VERSION[-1] == '0' else 'debug'
@@ -366,6 +366,56 @@ class Ui_MainWindow(object):
 
         self.gridLayout_9.addWidget(self.frame_5, 0, 4, 1, 1)
 
+        self.welchChkb = QCheckBox(self.frame_3)
+        self.welchChkb.setObjectName(u"welchChkb")
+
+        self.gridLayout_9.addWidget(self.welchChkb, 1, 0, 1, 1)
+
+        self.welchSegLab = QLabel(self.frame_3)
+        self.welchSegLab.setObjectName(u"welchSegLab")
+
+        self.gridLayout_9.addWidget(self.welchSegLab, 1, 2, 1, 1)
+
+        self.welchSegEntry = QLineEdit(self.frame_3)
+        self.welchSegEntry.setObjectName(u"welchSegEntry")
+
+        self.gridLayout_9.addWidget(self.welchSegEntry, 1, 3, 1, 1)
+
+        self.welchFrm = QFrame(self.frame_3)
+        self.welchFrm.setObjectName(u"welchFrm")
+        self.welchFrm.setFrameShape(QFrame.Shape.NoFrame)
+        self.welchFrm.setFrameShadow(QFrame.Shadow.Raised)
+        self.horizontalLayout_3 = QHBoxLayout(self.welchFrm)
+        self.horizontalLayout_3.setObjectName(u"horizontalLayout_3")
+        self.horizontalLayout_3.setContentsMargins(0, 0, 0, 0)
+        self.welchOverlapLab = QLabel(self.welchFrm)
+        self.welchOverlapLab.setObjectName(u"welchOverlapLab")
+
+        self.horizontalLayout_3.addWidget(self.welchOverlapLab)
+
+        self.welchOverlapEntry = QLineEdit(self.welchFrm)
+        self.welchOverlapEntry.setObjectName(u"welchOverlapEntry")
+
+        self.horizontalLayout_3.addWidget(self.welchOverlapEntry)
+
+        self.welchWindowLab = QLabel(self.welchFrm)
+        self.welchWindowLab.setObjectName(u"welchWindowLab")
+
+        self.horizontalLayout_3.addWidget(self.welchWindowLab)
+
+        self.welchWindowComb = QComboBox(self.welchFrm)
+        self.welchWindowComb.addItem("")
+        self.welchWindowComb.addItem("")
+        self.welchWindowComb.addItem("")
+        self.welchWindowComb.addItem("")
+        self.welchWindowComb.addItem("")
+        self.welchWindowComb.setObjectName(u"welchWindowComb")
+
+        self.horizontalLayout_3.addWidget(self.welchWindowComb)
+
+
+        self.gridLayout_9.addWidget(self.welchFrm, 1, 4, 1, 1)
+
 
         self.verticalLayout_3.addWidget(self.frame_3)
 
@@ -972,6 +1022,19 @@ class Ui_MainWindow(object):
         self.label_6.setText("")
         self.mspFreqLab.setText(QCoreApplication.translate("MainWindow", u"Freq", None))
         self.mspChkb.setText(QCoreApplication.translate("MainWindow", u"Manual search peak", None))
+#if QT_CONFIG(tooltip)
+        self.welchChkb.setToolTip(QCoreApplication.translate("MainWindow", u"f, psd = signal.welch(<data>, fs=<data rate>, window=<window>, nperseg=<segment>, noverlap=<overlap>x<segment>)\n"
+"unchecked: one periodogram of the whole data, nperseg=len(<data>)", None))
+#endif // QT_CONFIG(tooltip)
+        self.welchChkb.setText(QCoreApplication.translate("MainWindow", u"Welch PSD segments", None))
+        self.welchSegLab.setText(QCoreApplication.translate("MainWindow", u"Segment", None))
+        self.welchOverlapLab.setText(QCoreApplication.translate("MainWindow", u"Overlap", None))
+        self.welchWindowLab.setText(QCoreApplication.translate("MainWindow", u"Window", None))
+        self.welchWindowComb.setItemText(0, QCoreApplication.translate("MainWindow", u"hann", None))
+        self.welchWindowComb.setItemText(1, QCoreApplication.translate("MainWindow", u"hamming", None))
+        self.welchWindowComb.setItemText(2, QCoreApplication.translate("MainWindow", u"blackman", None))
+        self.welchWindowComb.setItemText(3, QCoreApplication.translate("MainWindow", u"flattop", None))
+        self.welchWindowComb.setItemText(4, QCoreApplication.translate("MainWindow", u"boxcar", None))
 #if QT_CONFIG(tooltip)
         self.hpfChkb.setToolTip(QCoreApplication.translate("MainWindow", u"b, a = butter(<order>, <freq>/(0.5x<data rate>), btype='high')\n"
 "new_data = lfilter(b, a, <data>, axis=-1)\n"
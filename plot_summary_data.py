@@ -13,6 +13,7 @@ from matplotlib.gridspec import GridSpec
 import re
 import logging
 from data_visualization_utility import ErrorCode
+from data_parser_utility import load_data_file
 import datetime
 import os
 
@@ -82,7 +83,7 @@ class SummaryDataParser:
 
         if self.data_file is not None:
             try:
-                self.df_data = pd.read_csv(self.data_file)
+                self.df_data = load_data_file(self.data_file)
                 self.df_data = self.df_data.iloc[:, 3:]
             except Exception as ex:
                 self.logger.error(f"Exception: {str(ex)}")
@@ -0,0 +1,6 @@
+# -*- coding: UTF-8 -*-
+import os
+import sys
+
+# the modules are in the repo root, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,90 @@
+# -*- coding: UTF-8 -*-
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+from data_analysis_utility import analyze, ErrorCode, VisualizeParameters
+from data_cache_utility import ArrayCache
+from data_parser_utility import save_data_file
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_script(_script: str, *args) -> subprocess.CompletedProcess:
+    # a new interpreter, other tests of this session import pyplot
+    return subprocess.run([sys.executable, "-c", _script, *args], cwd=ROOT, capture_output=True, text=True)
+
+
+def test_import_does_not_load_pyplot():
+    _ret = run_script("import sys, data_analysis_utility\nassert 'matplotlib.pyplot' not in sys.modules")
+    assert _ret.returncode == 0, _ret.stderr
+
+
+def test_analyze_does_not_load_pyplot(tmp_path):
+    _data_file = str(tmp_path / "emg.csv")
+    _t = np.arange(4000) / 1000
+    pd.DataFrame({"CH1": 2048 + 800 * np.sin(2 * np.pi * 50 * _t),
+                  "CH2": 2048 + 400 * np.sin(2 * np.pi * 80 * _t)}).to_csv(_data_file, index=False)
+    _script = "\n".join([
+        "import sys",
+        "from data_analysis_utility import analyze, ErrorCode, VisualizeParameters",
+        "params = VisualizeParameters()",
+        "params.sensor = 'emg'",
+        "params.data_type = 'Raw Data'",
+        "params.data_file = sys.argv[1]",
+        "params.sample_rate = 1000",
+        "params.data_drop = [10, 10]",
+        "err, res = analyze(params)",
+        "assert err == ErrorCode.ERR_NO_ERROR, err",
+        "assert res.channels == ['CH1', 'CH2'], res.channels",
+        "assert 'matplotlib.pyplot' not in sys.modules",
+    ])
+    _ret = run_script(_script, _data_file)
+    assert _ret.returncode == 0, _ret.stderr
+
+
+def emg_params(**kwargs) -> VisualizeParameters:
+    params = VisualizeParameters()
+    params.sensor = "emg"
+    params.data_type = "Raw Data"
+    params.sample_rate = 1000
+    params.data_drop = [10, 10]
+    for key, val in kwargs.items():
+        setattr(params, key, val)
+    return params
+
+
+def test_analyze_loads_npz_data_file(tmp_path):
+    _t = np.arange(4000) / 1000
+    _df = pd.DataFrame({"CH1": 2048 + 800 * np.sin(2 * np.pi * 50 * _t),
+                        "CH2": 2048 + 400 * np.sin(2 * np.pi * 80 * _t)})
+    _data_file = save_data_file(_df, str(tmp_path / "emg.npz"))
+    _err, _result = analyze(emg_params(data_file=_data_file))
+    assert _err == ErrorCode.ERR_NO_ERROR
+    _err, _expected = analyze(emg_params(df_data=_df))
+    assert _err == ErrorCode.ERR_NO_ERROR
+    assert _result.channels == ["CH1", "CH2"]
+    pd.testing.assert_frame_equal(_result.statistics(), _expected.statistics())
+    assert np.array_equal(_result.spectrum, _expected.spectrum)
+
+
+def test_analyze_keeps_decimation_and_spectrum_rate(tmp_path):
+    _t = np.arange(4000) / 1000
+    _df = pd.DataFrame({"CH1": 2048 + 800 * np.sin(2 * np.pi * 50 * _t),
+                        "CH2": 2048 + 400 * np.sin(2 * np.pi * 80 * _t)})
+    result_cache = ArrayCache(path=str(tmp_path / "result_cache"))
+    _results = list()
+    for i in range(2):  # calculated, then from result_cache
+        _err, _result = analyze(emg_params(df_data=_df, decimate=True, freq_scale={"x": {"start": 0, "end": 100}}),
+                                result_cache=result_cache)
+        assert _err == ErrorCode.ERR_NO_ERROR
+        _results.append(_result)
+    assert result_cache.hits == 2
+    for _result in _results:
+        assert _result.decimation.tolist() == [3, 3]
+        assert _result.spectrum_rate.tolist() == [1000 / 3, 1000 / 3]
+        _columns = _result.statistics().columns.tolist()
+        assert _columns[_columns.index("FFT size") + 1:][:2] == ["Decimation", "Spectrum rate"]
+    pd.testing.assert_frame_equal(_results[0].statistics(), _results[1].statistics())
@@ -0,0 +1,122 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+import time
+import zipfile
+import numpy as np
+import data_cache_utility
+from data_cache_utility import file_digest, DataCache, ArrayCache, StageCache, CACHE_INDEX_FILE, CACHE_TEMP_AGE
+
+
+def test_file_digests_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_cache_utility, "FILE_DIGEST_ENTRIES", 3)
+    data_cache_utility.file_digests.clear()
+    _files = list()
+    for i in range(5):
+        _files.append(tmp_path / f"{i}.log")
+        _files[-1].write_text(f"data {i % 2}")
+    _digests = [file_digest(str(val)) for val in _files]
+    assert _digests[0] == _digests[2] != _digests[1]
+    assert len(data_cache_utility.file_digests) == 3
+    # recently used digest is kept
+    file_digest(str(_files[2]))
+    file_digest(str(_files[0]))
+    assert len(data_cache_utility.file_digests) == 3
+    assert str(_files[2]) in [val[0] for val in data_cache_utility.file_digests]
+
+
+def test_array_cache_saves_arrays_in_npz_and_scalars_in_index(tmp_path):
+    cache = ArrayCache(path=str(tmp_path), compressed=["spectrum"])
+    _value = {"channel": "CH1", "rms": np.float64(1.25), "size": np.int64(4096), "harmonics": [(100.0, -3.5)],
+              "spectrum": np.linspace(0, 1, 1000), "sig": np.random.default_rng(0).standard_normal(1000)}
+    assert cache.put("k1", _value)
+    assert not os.path.exists(os.path.join(str(tmp_path), CACHE_INDEX_FILE))  # saved by flush
+    assert cache.flush()
+    with zipfile.ZipFile(cache.file_of("k1")) as _zip:
+        assert {val.filename: val.compress_type for val in _zip.infolist()} == \
+            {"spectrum.npy": zipfile.ZIP_DEFLATED, "sig.npy": zipfile.ZIP_STORED}
+    with open(os.path.join(str(tmp_path), CACHE_INDEX_FILE)) as _fh:
+        assert json.load(_fh)["k1"] == {"channel": "CH1", "rms": 1.25, "size": 4096, "harmonics": [[100.0, -3.5]]}
+    # a new cache object reads the index from the folder, the same python types as the index in memory
+    _cached = ArrayCache(path=str(tmp_path)).get("k1")
+    assert np.array_equal(_cached["spectrum"], _value["spectrum"]) and np.array_equal(_cached["sig"], _value["sig"])
+    assert (_cached["rms"], _cached["size"], _cached["channel"]) == (1.25, 4096, "CH1")
+    _in_memory = cache.get("k1")
+    for name in ["channel", "rms", "size", "harmonics"]:
+        assert type(_in_memory[name]) is type(_cached[name]) and _in_memory[name] == _cached[name]
+    assert cache.hits == 1
+    assert cache.get("k2") is None and (cache.hits, cache.misses) == (1, 1)
+
+
+def test_array_cache_evict_drops_index(tmp_path):
+    cache = ArrayCache(path=str(tmp_path), max_size=1 << 14)
+    for i in range(4):
+        cache.put(f"k{i}", {"i": i, "sig": np.random.default_rng(i).standard_normal(1000)})  # ~7.7k compressed
+        os.utime(cache.file_of(f"k{i}"), ns=(i * 10 ** 9, i * 10 ** 9))  # k0 is the least recently used
+    assert sorted(cache.load_index()) == ["k2", "k3"]
+    assert cache.flush()
+    assert ArrayCache(path=str(tmp_path)).get("k3")["i"] == 3
+    cache.clear()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_array_cache_saves_index_once_per_flush(tmp_path, monkeypatch):
+    cache = ArrayCache(path=str(tmp_path))
+    _saved = list()
+    _replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: (_saved.append(os.path.basename(dst)), _replace(src, dst)))
+    for i in range(5):
+        cache.put(f"k{i}", {"i": i, "sig": np.arange(10.0)})
+    assert cache.flush() and cache.flush()
+    assert _saved.count(CACHE_INDEX_FILE) == 1
+
+
+def test_array_cache_merges_index_of_other_processes(tmp_path):
+    cache = ArrayCache(path=str(tmp_path))
+    other = ArrayCache(path=str(tmp_path))
+    cache.put("k1", {"i": 1, "sig": np.arange(10.0)})
+    other.put("k2", {"i": 2, "sig": np.arange(10.0)})
+    assert other.flush() and cache.flush()
+    assert sorted(ArrayCache(path=str(tmp_path)).load_index()) == ["k1", "k2"]
+
+
+def test_array_cache_drops_stale_index_on_miss(tmp_path):
+    cache = ArrayCache(path=str(tmp_path))
+    cache.put("k1", {"i": 1, "sig": np.arange(10.0)})
+    assert cache.flush()
+    os.remove(cache.file_of("k1"))  # e.g. evicted by another process
+    assert cache.get("k1") is None and cache.misses == 1
+    assert "k1" not in cache.load_index()
+    assert cache.flush()
+    with open(os.path.join(str(tmp_path), CACHE_INDEX_FILE)) as _fh:
+        assert json.load(_fh) == {}
+
+
+def test_evict_and_clear_remove_stale_temp_files(tmp_path):
+    cache = DataCache(path=str(tmp_path), max_size=1 << 20)
+    _stale = tmp_path / "a.pkl.123.tmp"
+    _stale.write_bytes(b"x" * 100)
+    os.utime(str(_stale), (time.time() - CACHE_TEMP_AGE - 1, time.time() - CACHE_TEMP_AGE - 1))
+    _fresh = tmp_path / "b.pkl.456.tmp"  # may be written by another process
+    _fresh.write_bytes(b"x" * 100)
+    cache.put("k1", [1, 2, 3])
+    assert sorted(os.listdir(str(tmp_path))) == ["b.pkl.456.tmp", cache.file_of("k1").split(os.sep)[-1]]
+    cache.clear()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_stage_cache_keeps_one_output_per_stage():
+    cache = StageCache(stages=["decode", "filter"])
+    assert cache.statistics() == {"decode": [0, 0], "filter": [0, 0]}
+    assert cache.get("filter", "a") is None
+    cache.put("filter", "a", 1)
+    assert cache.get("filter", "a") == 1
+    # a miss drops the output of the old key before the new one is calculated
+    assert cache.get("filter", "b") is None
+    assert len(cache.entries["filter"]) == 0
+    cache.put("filter", "b", 2)
+    assert list(cache.entries["filter"]) == ["b"]
+    assert cache.hits == {"decode": 0, "filter": 1}
+    assert cache.misses == {"decode": 0, "filter": 2}
+    cache.clear()
+    assert cache.statistics() == {"decode": [0, 0], "filter": [0, 0]}
@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import data_parser_utility
+from data_parser_utility import ErrorCode, RawSensorDataParser, RawDataParser, JsonBackend, parse_emg_lines, \
+    make_emg_dump, emg_parser_benchmark
+
+
+def test_emg_block_parser_same_as_line_parser():
+    _text = make_emg_dump(5000) + "1.00000a\t" * 8 + "\n" + "1.0000001" + "1.000000\t" * 7 + "\r\n\x1c" + \
+        "9.999999\t" * 8 + "\r\n" + "0.000001\t" * 8
+    _err, _df = RawSensorDataParser(chunk_size=4096).extract_sensor_data(_data=_text, _sensor="emg")
+    assert _err == ErrorCode.ERR_NO_ERROR
+    assert np.array_equal(_df.to_numpy(), parse_emg_lines(_text))
+
+
+# the block parser is requested to be at least 10x the throughput of the line parser, wall clock timing depends
+# on the machine and its load, so it only runs with RUN_BENCHMARKS=1
+@pytest.mark.skipif(os.environ.get("RUN_BENCHMARKS") != "1", reason="set RUN_BENCHMARKS=1 to run benchmarks")
+def test_emg_block_parser_throughput():
+    _df = emg_parser_benchmark(make_emg_dump(200000), _repeat=3)
+    assert _df["speedup"].iloc[1] >= 10, _df.to_string()
+
+
+def json_samples(_ts: int) -> str:
+    return f'{{"samples": [{{"name": "Timestamp", "value": {_ts}}}, {{"name": "Raw", "value": 1.5}}]}}'
+
+
+def test_json_scan_after_bad_object_at_the_end():
+    _text = "FT> {\n" + '"data": [\n' + json_samples(1) + ",\n" + \
+        '{"samples": [{"name": "Timestamp", "value": 2}, {"name": "Raw", "value": }]},\n' + \
+        json_samples(3) + "\n]}\n"
+    _objs = list(RawSensorDataParser().iter_json_data(_text, [r'\{(?:[^{}]*?"data": \[)']))
+    assert [obj["samples"][0]["value"] for obj in _objs] == [1, 3]
+
+
+def test_json_scan_ignores_unfinished_object_at_the_end():
+    _text = '"data": [\n' + json_samples(1) + ",\n" + json_samples(2) + \
+        ',\n{"samples": [{"name": "Timestamp", "value": 3}, {"name": "Raw", "val'
+    for chunk_size in [16, 4096]:
+        _objs = list(RawSensorDataParser(chunk_size=chunk_size).iter_json_data(_text))
+        assert [obj["samples"][0]["value"] for obj in _objs] == [1, 2]
+
+
+def ppg_samples(_mes, _ts, _pd1="1.0") -> str:
+    _items = [] if _mes is None else [f'{{"name": "measurement", "value": {_mes}}}']
+    _items += [f'{{"name": "timestamp", "value": {_ts}}}', f'{{"name": "pd_1", "value": {_pd1}}}',
+               '{"name": "pd_2", "value": 2}', '{"name": "pd_3", "value": 3}', '{"name": "pd_4", "value": 4}']
+    return '{"samples": [' + ", ".join(_items) + "]}"
+
+
+def test_ppg_measurement_id_without_float_format():
+    _text = '{"data": [' + ", ".join([ppg_samples(1, 10), ppg_samples(None, 11), ppg_samples(2, 12),
+                                      ppg_samples(1, 13), ppg_samples(2, 14)]) + "]}"
+    _err, _df = RawSensorDataParser().extract_sensor_data(_data=_text, _sensor="ppg")
+    assert _err == ErrorCode.ERR_NO_ERROR
+    assert list(_df.columns)[:2] == ["MES1_timestamp", "MES1_pd_1"]
+    assert "MES2_pd_4" in _df.columns
+    assert _df["MES1_timestamp"].tolist() == [10, 13]
+
+
+def test_sample_decoder_string_value_only_affects_its_column():
+    _samples = [[{"name": "Time", "value": 1}, {"name": "Raw", "value": 1.5}],
+                [{"name": "Time", "value": 2}, {"name": "Raw", "value": "overflow"}],
+                [{"name": "Time", "value": 3}, {"name": "Raw", "value": 2.5}]]
+    _err, _columns = RawSensorDataParser().extract_df_columns(_samples, "als")
+    assert _err == ErrorCode.ERR_NO_ERROR
+    assert _columns["Time"].dtype == np.int64 and _columns["Time"].tolist() == [1, 2, 3]
+    assert _columns["Raw"].tolist() == [1.5, "overflow", 2.5]
+
+
+def test_parser_kwargs_keep_the_settings():
+    _parser = RawSensorDataParser(chunk_size=12345, use_mmap=False, json_backend="json")
+    _worker = RawDataParser("bali", **_parser.parser_kwargs())
+    assert (_worker.chunk_size, _worker.use_mmap, _worker.json.name) == (12345, False, "json")
+
+
+# delta decoding of the emg parsers before the shared decoder, element by element
+def decompress_emg_loops(_arr, _ch_num: int) -> np.ndarray:
+    output_arr = np.reshape(np.array(_arr), (-1, _ch_num * 2))
+    base_timestamp = 0
+    for i in range(len(output_arr)):
+        output_arr[i][1] = output_arr[i][1] + base_timestamp
+        base_timestamp = output_arr[i][1]
+        for j in range(1, _ch_num):
+            output_arr[i][2 * j + 1] = output_arr[i][2 * j + 1] + base_timestamp
+    for i in range(1, len(output_arr)):
+        for j in range(0, _ch_num):
+            output_arr[i][2 * j] = output_arr[i][2 * j] + output_arr[i - 1][2 * j]
+    return output_arr
+
+
+@pytest.mark.parametrize("project, ch_num", [["bali", 20], ["tycho", 20], ["gen2", 20], ["ceres", 8]])
+def test_emg_decompress_same_as_loops(project, ch_num):
+    _arr = np.random.default_rng(ch_num).integers(-2000, 2000, 300 * ch_num * 2).tolist()
+    _text = "FT> " + json.dumps({"output": {"adc_data": _arr}}) + "\n"
+    _err, _df = RawDataParser(project).extract_sensor_data(_data=_text, _sensor="emg")
+    assert _err == ErrorCode.ERR_NO_ERROR
+    _expected = decompress_emg_loops(_arr, ch_num)
+    if project == "ceres":  # adc code to voltage
+        _expected = pd.DataFrame(_expected).div(65536).mul(5).to_numpy()
+    assert len(_df.columns) == ch_num * 2
+    assert np.array_equal(_df.to_numpy(), _expected)
+
+
+def test_ceres_tester_data_converted_line_by_line(tmp_path):
+    _file = tmp_path / "tester.csv"
+    _file.write_text("Station1,,,\nEMG1,100,200,300\nTemp,1.5,2.5\n")
+    _err, _df = RawDataParser("ceres", chunk_size=8).convert_sensor_data(_source_file=str(_file), _sensor="emg")
+    assert _err == ErrorCode.ERR_NO_ERROR
+    assert list(_df.columns) == ["Station1_EMG1", "Station1_Temp"]
+    assert np.array_equal(_df["Station1_EMG1"].to_numpy(), np.array([100, 200, 300]) / 65536 * 5)
+    assert np.array_equal(_df["Station1_Temp"].to_numpy(), [1.5, 2.5, np.nan], equal_nan=True)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_json_document_read_by_blocks(tmp_path, use_mmap):
+    _arr = list(range(400))
+    _text = "FT> " + json.dumps({"output": {"adc_data": _arr}}) + "\nlog after\n"
+    _file = tmp_path / "bali.log"
+    _file.write_text("log before\n" + _text)
+    _parser = RawDataParser("bali", chunk_size=16, use_mmap=use_mmap)
+    _err, _df = _parser.extract_sensor_data(_source_file=str(_file), _sensor="emg")
+    assert _err == ErrorCode.ERR_NO_ERROR
+    _err, _expected = RawDataParser("bali").extract_sensor_data(_data=_text, _sensor="emg")
+    assert _df.equals(_expected)
+
+
+def sensor_log(_sensor: str, _rows: int = 5) -> str:
+    _names = RawSensorDataParser().ref_key_names[_sensor]
+    _objs = list()
+    for i in range(_rows):
+        _values = {name: (i % 2 if name == "Sensor" else i * 10 + k + 0.5) for k, name in enumerate(_names)}
+        for desc in (["IMU gyro data", "IMU accelerometer data", "IMU temperature data"] if _sensor == "imu" else
+                     [None]):
+            _obj = {"samples": [{"name": name, "value": val} for name, val in _values.items()]}
+            if desc is not None:
+                _obj["desc"] = desc
+            _objs.append(_obj)
+    return "FT> " + json.dumps({"data": _objs}) + "\n"
+
+
+@pytest.mark.parametrize("backend", JsonBackend.available() + [None])
+def test_json_backends_give_the_same_frames(backend):
+    for project, _sensor in [["bali", "emg"], ["bali", "imu"], ["malibu", "ppg"], ["malibu", "imu"],
+                             ["malibu", "mag"], ["malibu", "alt"], ["malibu", "bti"], ["malibu", "als"]]:
+        if project == "bali":
+            _output = {"adc_data": list(range(80))} if _sensor == "emg" else \
+                {"accel(micro-g)": list(range(6)), "gyro(micro-dps)": list(range(6)), "temp(micro-degrees)": [25, 26],
+                 "timestamp": [1, 2]}
+            _text = "FT> " + json.dumps({"output": _output}) + "\n"
+        elif _sensor == "ppg":
+            _text = '{"data": [' + ", ".join([ppg_samples(1 + i % 2, i) for i in range(6)]) + "]}"
+        else:
+            _text = sensor_log(_sensor)
+        _err, _expected = RawDataParser(project, json_backend="json").extract_sensor_data(_data=_text,
+                                                                                          _sensor=_sensor)
+        assert _err == ErrorCode.ERR_NO_ERROR, (project, _sensor)
+        _err, _df = RawDataParser(project, json_backend=backend).extract_sensor_data(_data=_text, _sensor=_sensor)
+        assert _err == ErrorCode.ERR_NO_ERROR and _df.equals(_expected), (project, _sensor)
+
+
+def test_json_backend_is_logged_once(caplog, monkeypatch):
+    monkeypatch.setattr(data_parser_utility, "logged_json_backends", set())
+    with caplog.at_level(logging.INFO):
+        for i in range(3):
+            RawDataParser("bali", json_backend="json")
+    assert [rec.getMessage() for rec in caplog.records].count("json backend: json") == 1
@@ -0,0 +1,290 @@
+# -*- coding: UTF-8 -*-
+import logging
+import os
+import tracemalloc
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import signal
+from scipy.signal import sosfilt, sosfiltfilt
+from data_cache_utility import StageCache
+from data_visualization_utility import ErrorCode, VisualizeParameters, DataVisualization, GEN2DataVisualization, \
+    DataVisualize, design_butter_filter, design_notch_filter, design_zoom_fft
+
+SAMPLE_RATE = 2000
+
+
+def emg_signals(_channels: int = 3, _samples: int = 8000) -> np.ndarray:
+    _rng = np.random.default_rng(1)
+    _t = np.arange(_samples) / SAMPLE_RATE
+    return 1.5 + np.sin(2 * np.pi * 50 * _t) + 0.2 * np.sin(2 * np.pi * 180 * _t) + \
+        0.05 * _rng.standard_normal((_channels, _samples))
+
+
+# one filter after another, each high/low pass moves its input to start from 0, as the per-stage filters do,
+# the cached designs are read only, sosfilt needs a writable copy
+def unfused_filters(_sig: np.ndarray, _high: dict, _low: dict, _notch: dict) -> np.ndarray:
+    _func = {"filtfilt": sosfiltfilt, "lfilter": sosfilt}
+    for btype, _filter in [["high", _high], ["low", _low]]:
+        if _filter["type"]:
+            _, _, _sos = design_butter_filter(int(_filter["order"]), float(_filter["freq"]), btype, SAMPLE_RATE)
+            _sig = _func[_filter["type"]](np.array(_sos), _sig - _sig[..., :1], axis=-1)
+    for f in _notch.values():
+        _, _, _sos = design_notch_filter(float(f["freq"]), float(f["qvalue"]), SAMPLE_RATE)
+        _sig = sosfilt(np.array(_sos), _sig, axis=-1)
+    return _sig
+
+
+@pytest.mark.parametrize("high_type, low_type", [["filtfilt", "filtfilt"], ["lfilter", "lfilter"],
+                                                 ["filtfilt", "lfilter"], ["lfilter", "filtfilt"]])
+@pytest.mark.parametrize("inplace", [False, True])
+def test_filter_chain_same_as_unfused_filters(high_type, low_type, inplace):
+    dv = DataVisualization()
+    dv.parameters.sample_rate = SAMPLE_RATE
+    dv.parameters.high_pass_filter = {"type": high_type, "order": 4, "freq": 20}
+    dv.parameters.low_pass_filter = {"type": low_type, "order": 4, "freq": 450}
+    dv.parameters.notch_filter = {"1": {"freq": 60, "qvalue": 30}}
+    _sig = emg_signals()
+    _expected = unfused_filters(_sig, dv.parameters.high_pass_filter, dv.parameters.low_pass_filter,
+                                dv.parameters.notch_filter)
+    _err, _filtered = dv.filter_signals(_sig.copy(), _inplace=inplace)
+    assert _err == ErrorCode.ERR_NO_ERROR
+    np.testing.assert_allclose(_filtered, _expected, rtol=0, atol=1e-9)
+    _rms = np.sqrt(np.mean(_filtered ** 2, axis=-1))
+    np.testing.assert_allclose(_rms, np.sqrt(np.mean(_expected ** 2, axis=-1)), rtol=1e-9)
+
+
+# peak of traced memory of trimming and filtering, the raw columns are allocated before tracing,
+# with a stage cache they run as the filter stage and their buffer is memoized
+def trim_and_filter_peak(_precision: str, _channels: int = 8, _samples: int = 1 << 17,
+                         _stage_cache: StageCache = None) -> int:
+    dv = DataVisualization(stage_cache=_stage_cache)
+    dv.parameters.sample_rate = SAMPLE_RATE
+    dv.parameters.precision = _precision
+    dv.parameters.high_pass_filter = {"type": "filtfilt", "order": 4, "freq": 20}
+    dv.parameters.low_pass_filter = {"type": "filtfilt", "order": 4, "freq": 450}
+    dv.parameters.notch_filter = {"1": {"freq": 60, "qvalue": 30}}
+    channels = [f"CH{i}" for i in range(_channels)]
+    df_data = pd.DataFrame(dict(zip(channels, emg_signals(_channels, _samples))))
+    dv.filter_signals(emg_signals(1, 1000), True)  # filter designs are cached before tracing
+    tracemalloc.start()
+    try:
+        def trim_and_filter():
+            _err_code, (_ac_signal, _dc_bias) = dv.trim_emg_channels(df_data, channels)
+            assert _err_code == ErrorCode.ERR_NO_ERROR
+            _err_code, _filtered = dv.filter_signals(_ac_signal, True)
+            assert _err_code == ErrorCode.ERR_NO_ERROR and _filtered is _ac_signal
+            return _err_code, (_filtered, _dc_bias)
+        _err, (ac_signal, dc_bias) = dv.run_stage("filter", [_precision, channels], trim_and_filter)
+        assert _err == ErrorCode.ERR_NO_ERROR
+        if _stage_cache is not None:  # the memoized output is the filtered buffer itself
+            assert _stage_cache.get("filter", dv.stage_keys["filter"])[0] is ac_signal
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_trim_and_filter_peak_memory_is_one_signal_per_channel():
+    _channels, _samples = 8, 1 << 17
+    _per_channel = trim_and_filter_peak("float64", _channels, _samples) / _channels / (_samples * 8)
+    assert _per_channel < 1.5
+
+
+def test_stage_cache_keeps_peak_memory_one_signal_per_channel():
+    _channels, _samples = 8, 1 << 17
+    _peak = trim_and_filter_peak("float64", _channels, _samples, StageCache(stages=["filter"]))
+    assert _peak / _channels / (_samples * 8) < 1.5
+
+
+def test_float32_peak_memory_is_lower():
+    assert trim_and_filter_peak("float32") < 0.75 * trim_and_filter_peak("float64")
+
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+@pytest.mark.parametrize("inplace", [False, True])
+def test_filtered_signals_keep_the_precision(precision, inplace):
+    dv = DataVisualization()
+    dv.parameters.sample_rate = SAMPLE_RATE
+    dv.parameters.precision = precision
+    dv.parameters.high_pass_filter = {"type": "filtfilt", "order": 4, "freq": 20}
+    dv.parameters.low_pass_filter = {"type": "lfilter", "order": 4, "freq": 450}
+    dv.parameters.notch_filter = {"1": {"freq": 60, "qvalue": 30}}
+    _err, _filtered = dv.filter_signals(emg_signals().astype(precision), _inplace=inplace)
+    assert _err == ErrorCode.ERR_NO_ERROR
+    assert _filtered.dtype == np.dtype(precision)
+    # the whole emg path, from the raw columns to the spectra
+    dv.parameters.data_type = "Raw Data"
+    dv.parameters.data_drop = [10, 10]
+    dv.parameters.df_data = pd.DataFrame(dict(zip(["CH1", "CH2"], 2048 + 800 * emg_signals(2, 4000))))
+    _err, _data = dv.calculate_emg_channels(["CH1", "CH2"])
+    assert _err == ErrorCode.ERR_NO_ERROR
+    assert [val.dtype for val in _data["sig"] + _data["target_sig"]] == [np.dtype(precision)] * 4
+
+
+def test_zoom_fft_is_shared_by_bands_of_the_same_width():
+    dv = DataVisualization()
+    dv.parameters.sample_rate = SAMPLE_RATE
+    dv.parameters.peak_zoom = 64
+    dv.parameters.harmonics = [2, 3]
+    _t = np.arange(6001) / SAMPLE_RATE
+    _freqs = [50.0123, 61.37, 75.5]
+    _sig = np.stack([np.sin(2 * np.pi * f * _t) + 0.05 * np.sin(2 * np.pi * 2 * f * _t) for f in _freqs])
+    _err, (target_freq, target_sig, peak_freq, peak_sig) = dv.do_fft_convertion(_sig)
+    assert _err == ErrorCode.ERR_NO_ERROR
+    dv.target_channels = ["a", "b", "c"]
+    dv.target_data = {"target_freq": [target_freq] * 3, "target_sig": list(target_sig), "sig": list(_sig),
+                      "target_freq_peak": list(peak_freq), "target_sig_peak": list(peak_sig)}
+    design_zoom_fft.cache_clear()
+    dv.refine_peak_points()
+    # 3 channels x (peak + 2 harmonics) bands, one zoom fft
+    assert design_zoom_fft.cache_info().misses == 1 and design_zoom_fft.cache_info().hits == 8
+    _half = dv.parameters.peak_zoom_span * SAMPLE_RATE / dv.fft_size
+    for k, h in enumerate([1, 2, 3]):
+        for i, f in enumerate(_freqs):
+            # peak band is around the fft peak, harmonic bands around h x the refined peak
+            _center = peak_freq[i] if h == 1 else dv.zoom_data[0][i][0] * h
+            _zoom = signal.ZoomFFT(len(_t), [_center - _half, _center + _half], 64, fs=SAMPLE_RATE, endpoint=True)
+            _amp = np.abs(_zoom(_sig[i]))
+            _best = np.argmax(_amp)
+            assert dv.zoom_data[k][i][0] == pytest.approx(np.linspace(_center - _half, _center + _half, 64)[_best])
+            assert dv.zoom_data[k][i][1] == pytest.approx(20 * np.log10(_amp[_best]), abs=1e-6)
+        assert abs(dv.zoom_data[0][i][0] - f) < 0.01
+
+
+def test_repeated_run_saves_files_again(tmp_path):
+    matplotlib.use("Agg")
+    logger = logging.getLogger("test_export")
+    logger.log_path = str(tmp_path / "log")
+    os.makedirs(logger.log_path)
+    _data_file = str(tmp_path / "emg.csv")
+    pd.DataFrame(dict(zip(["CH1", "CH2"], 2048 + 800 * emg_signals(2, 4000)))).to_csv(_data_file, index=False)
+    stage_cache = StageCache(logger=logger)
+    for i in range(2):
+        params = VisualizeParameters()
+        params.sensor = "emg"
+        params.data_type = "Raw Data"
+        params.data_file = _data_file
+        params.sample_rate = SAMPLE_RATE
+        params.plot_name = "emg"
+        params.data_drop = [10, 10]
+        dv = DataVisualize(params, logger=logger, stage_cache=stage_cache)
+        assert dv.visualize_data(params) == ErrorCode.ERR_NO_ERROR
+        plt.close("all")
+        # the files of the same analysis are saved again after they are deleted
+        _files = sorted(os.listdir(logger.log_path))
+        assert [os.path.splitext(val)[1] for val in _files] == [".csv", ".png"]
+        _columns = pd.read_csv(os.path.join(logger.log_path, _files[0])).columns.tolist()
+        assert _columns[_columns.index("FFT size") + 1] == "Decimation"
+        for val in _files:
+            os.remove(os.path.join(logger.log_path, val))
+    assert stage_cache.statistics()["metrics"] == [1, 1]
+
+
+def test_tone_mode_draws_markers_only(tmp_path):
+    matplotlib.use("Agg")
+    logger = logging.getLogger("test_tone")
+    logger.log_path = str(tmp_path)
+    params = VisualizeParameters()
+    params.sensor = "emg"
+    params.data_type = "Raw Data"
+    params.df_data = pd.DataFrame(dict(zip(["CH1", "CH2"], 2048 + 800 * emg_signals(2, 4000))))
+    params.sample_rate = SAMPLE_RATE
+    params.plot_name = "emg"
+    params.data_drop = [10, 10]
+    params.search_peak = 50
+    params.tone_only = True
+    dv = DataVisualize(params, logger=logger)
+    assert dv.visualize_data(params) == ErrorCode.ERR_NO_ERROR
+    assert dv.tone_harmonics is not None
+    # the measured bins are not drawn as a spectrum line, only the peak and harmonic markers
+    _bins = len(dv.target_data["target_freq"][0])
+    _lines = [len(line.get_xdata()) for ax in plt.gcf().axes for line in ax.get_lines()]
+    plt.close("all")
+    assert _bins not in _lines
+    assert _lines.count(1) == 2 * (1 + len(params.harmonics))
+
+
+# spectrum of one channel as calculate_emg_data did before the batched path, peak of the whole spectrum or of
+# the 3 bins around search_peak
+def channel_spectrum(_sig: np.ndarray, _type: str, _search_peak: float) -> tuple:
+    if _type in ["psd", "gen2 psd"]:
+        target_freq, psd = signal.welch(_sig, fs=SAMPLE_RATE, nperseg=len(_sig))
+        target_sig = 20 * np.log10(np.sqrt(psd)) if _type == "psd" else psd  # gen2 keeps the psd
+        target_rms = np.sqrt(sum(psd[1:int(SAMPLE_RATE / 2) + 1] * (target_freq[1] - target_freq[0])))
+    else:
+        fft_size = 2 ** int(np.ceil(np.log2(len(_sig))))
+        target_freq = np.fft.rfftfreq(fft_size, d=1 / SAMPLE_RATE)
+        target_sig = 20 * np.log10(np.abs(np.fft.rfft(_sig, fft_size)))
+        target_rms = None
+    if 0 < _search_peak <= np.argmax(target_freq):
+        idx = np.argmin(np.abs(target_freq - _search_peak))
+        _start = idx - 1 if 0 < idx < len(target_sig) else (0 if idx == 0 else idx - 2)
+        _idx = _start + np.argmax(target_sig[_start:_start + 3])
+    else:
+        _idx = np.argmax(target_sig)
+    return target_freq, target_sig, target_freq[_idx], target_sig[_idx], target_rms
+
+
+@pytest.mark.parametrize("convert_type", ["fft", "psd", "gen2 psd"])
+@pytest.mark.parametrize("search_peak", [0, 181])
+def test_batched_spectrum_same_as_per_channel(convert_type, search_peak):
+    dv = GEN2DataVisualization() if convert_type == "gen2 psd" else DataVisualization()
+    dv.parameters.sample_rate = SAMPLE_RATE
+    dv.parameters.search_peak = search_peak
+    _sig = emg_signals(4, 6000)
+    _sig -= _sig.mean(axis=-1, keepdims=True)
+    _func = dv.do_fft_convertion if convert_type == "fft" else dv.do_psd_convertion
+    _err, _result = _func(_sig)
+    assert _err == ErrorCode.ERR_NO_ERROR
+    target_freq, target_sig, peak_freq, peak_sig = _result[:4]
+    for i in range(len(_sig)):
+        _freq, _spectrum, _peak_freq, _peak_sig, _rms = channel_spectrum(_sig[i], convert_type, search_peak)
+        assert np.array_equal(target_freq, _freq)
+        np.testing.assert_allclose(target_sig[i], _spectrum, rtol=1e-12, atol=1e-9)
+        assert peak_freq[i] == _peak_freq
+        assert peak_sig[i] == pytest.approx(_peak_sig, rel=1e-12)
+        if convert_type != "fft":
+            assert _result[4][i] == pytest.approx(_rms, rel=1e-12)
+
+
+# max and min of each cycle of one channel, the loop calculate_emg_data used before reduceat
+def cycle_peaks_loop(_sig: np.ndarray, cycle_time: float) -> tuple:
+    num_cycles = int(len(_sig) / (cycle_time * SAMPLE_RATE))
+    max_vals = np.zeros(num_cycles)
+    min_vals = np.zeros(num_cycles)
+    for i in range(num_cycles):
+        cycle_start = int(i * cycle_time * SAMPLE_RATE)
+        cycle_end = int((i + 1) * cycle_time * SAMPLE_RATE)
+        max_vals[i] = np.max(_sig[cycle_start:cycle_end])
+        min_vals[i] = np.min(_sig[cycle_start:cycle_end])
+    return max_vals, min_vals
+
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_cycle_peaks_same_as_loop(precision):
+    dv = DataVisualization()
+    dv.parameters.sample_rate = SAMPLE_RATE
+    _sig = emg_signals(5, 5003).astype(precision)
+    # cycles which end exactly at the signal end, shorter than the signal, and no full cycle at all
+    _cycle_times = np.array([1 / 50, 1 / 61.37, 5003 / SAMPLE_RATE, 1 / 0.3, 1 / 181.1])
+    _max, _min = dv.calculate_cycle_peaks(_sig, _cycle_times)
+    for i, cycle_time in enumerate(_cycle_times):
+        max_vals, min_vals = cycle_peaks_loop(_sig[i], cycle_time)
+        assert np.array_equal(_max[i], max_vals) and np.array_equal(_min[i], min_vals)
+
+
+@pytest.mark.parametrize("fft_size, sample_rate", [[8192, SAMPLE_RATE], [6000, 1000], [4097, 3000], [2, 100]])
+def test_frequency_index_same_as_argmin(fft_size, sample_rate):
+    dv = DataVisualization()
+    _freq = np.fft.rfftfreq(fft_size, d=1 / sample_rate)
+    _rng = np.random.default_rng(2)
+    # random targets, bins, midpoints of the bins (ties go to the lower bin), out of the axis and not finite
+    _target = np.concatenate([_rng.uniform(-10, sample_rate, 500), _freq, (_freq[:-1] + _freq[1:]) / 2,
+                              [-1e9, 1e9, np.nan, np.inf, -np.inf]])
+    _expected = [np.argmin(np.abs(_freq - val)) for val in _target]
+    assert dv.locate_frequency_index(_freq, _target).tolist() == _expected
+    # any shape, e.g. (harmonics, channels)
+    assert dv.locate_frequency_index(_freq, _target[:500].reshape(50, 10)).tolist() == \
+        np.reshape(_expected[:500], (50, 10)).tolist()
@@ -8,6 +8,8 @@ from plot_summary_data import *
 from data_parser_utility import *
 import time
 from threading import Thread
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from data_cache_utility import *
 
 
 project_name = {
@@ -110,6 +112,14 @@ class FlowControl:
         self.manualSearchPeak = FilterEntry(checkbox_obj=self.ui.mspChkb, edit_objs={"freq": self.ui.mspFreqEntry},
                                             label_objs=[self.ui.mspFreqLab])
         self.manualSearchPeak.state_configure(0)
+        self.welchSegment = FilterEntry(checkbox_obj=self.ui.welchChkb, combobox_objs={"window": self.ui.welchWindowComb},
+                                        edit_objs={"nperseg": self.ui.welchSegEntry,
+                                                   "overlap": self.ui.welchOverlapEntry},
+                                        label_objs=[self.ui.welchSegLab, self.ui.welchOverlapLab,
+                                                    self.ui.welchWindowLab],
+                                        root=self.root, logger=self.logger)
+        self.welchSegment.set(edit={"nperseg": 4096, "overlap": 0.5})
+        self.welchSegment.state_configure(0)
         self.highPassFilter = FilterEntry(checkbox_obj=self.ui.hpfChkb, combobox_objs={"type": self.ui.hpfTypeComb},
                                           edit_objs={"order": self.ui.hpfOrdEntry, "freq": self.ui.hpfFreqEntry},
                                           label_objs=[self.ui.hpfTypeLab, self.ui.hpfOrdLab, self.ui.hpfFreqLab],
@@ -196,6 +206,39 @@ class FlowControl:
         self.item_filter = None
         self.project = "01"
         self.gain = 1.0
+        # processes to convert raw data files, 1 to convert one by one in GUI thread
+        self.convert_workers = kwargs['convert_workers'] if 'convert_workers' in kwargs else os.cpu_count()
+        # float type of signals and spectra in data visualization, float32 halves the memory
+        self.dv_params.precision = kwargs['precision'] if 'precision' in kwargs else "float64"
+        self.dv_params.fft_size_policy = kwargs['fft_size_policy'] if 'fft_size_policy' in kwargs else "pow2"
+        self.dv_params.fft_workers = kwargs['fft_workers'] if 'fft_workers' in kwargs else -1
+        # only measure the search peak and harmonic bins instead of the full spectrum, for statistics only runs,
+        # headless only, there is no ui control of it
+        self.dv_params.tone_only = kwargs['tone_only'] if 'tone_only' in kwargs else False
+        # points of the zoom fft around the peak and harmonics, 0: no sub-bin refinement
+        self.dv_params.peak_zoom = kwargs['peak_zoom'] if 'peak_zoom' in kwargs else 0
+        # fft of the signals decimated to the fft x scale, faster on a narrow frequency window
+        self.dv_params.decimate = kwargs['decimate'] if 'decimate' in kwargs else False
+        # format of the data file converted from raw data: csv, feather, parquet or npz
+        self.output_format = available_data_format(kwargs['output_format'] if 'output_format' in kwargs else "csv")
+        # parsed raw data, keyed by file content, project, sensor and parser version
+        self.parse_cache = DataCache(logger=self.logger,
+                                     path=kwargs['cache_path'] if 'cache_path' in kwargs else
+                                     os.path.join(os.path.abspath("."), "log", "cache"),
+                                     max_size=kwargs['cache_size'] if 'cache_size' in kwargs else DEFAULT_CACHE_SIZE)
+        # emg results of each channel, keyed by channel data and analysis parameters, arrays are compressed
+        self.result_cache = ArrayCache(logger=self.logger,
+                                       path=kwargs['result_cache_path'] if 'result_cache_path' in kwargs else
+                                       os.path.join(os.path.abspath("."), "log", "result_cache"),
+                                       max_size=kwargs['cache_size'] if 'cache_size' in kwargs else DEFAULT_CACHE_SIZE,
+                                       enable=kwargs['result_cache'] if 'result_cache' in kwargs else True,
+                                       compressed=RESULT_CACHE_COMPRESSED)
+        # outputs of the analysis stages in this session, a changed parameter only runs the stages after it
+        self.stage_cache = StageCache(logger=self.logger,
+                                      max_entries=kwargs['stage_entries'] if 'stage_entries' in kwargs else
+                                      STAGE_CACHE_ENTRIES,
+                                      enable=kwargs['stage_cache'] if 'stage_cache' in kwargs else True,
+                                      stages=PIPELINE_STAGES)
 
         self.signal.threadStateChanged.connect(self.on_thread_state_changed)
 
@@ -253,7 +296,7 @@ class FlowControl:
             for val in path_list:
                 if os.path.isdir(val):
                     files = os.listdir(val)
-                    _file_path = [os.path.join(val, file) for file in files if file.lower().endswith('.csv')
+                    _file_path = [os.path.join(val, file) for file in files if data_file_format(file) is not None
                                   or file.lower().endswith('.txt') or file.lower().endswith('.log')]
                 else:
                     _file_path.append(val)
@@ -345,8 +388,8 @@ class FlowControl:
             postfix = os.path.basename(file_list[0]).split(".")[-1]
             if postfix.lower() in ["txt", "log"]:
                 return 0  # raw data
-            elif postfix.lower() == "csv":
-                return 1  # csv data
+            elif postfix.lower() in DATA_FILE_FORMATS:
+                return 1  # tool format data, csv or binary
         return -1  # not select
 
     def on_data_type_changed(self, index):
@@ -373,17 +416,56 @@ class FlowControl:
             ret = self.get_df_data()
         return ret
 
-    #  from raw text to csv
+    # name and full path of the data file converted from raw data file, in self.output_format
+    def get_target_file(self, _source_file: str) -> (str, str):
+        _path = os.path.dirname(_source_file)
+        _n = os.path.basename(_source_file)
+        _time_now = time.strftime("%Y%m%d_%H%M%S", time.localtime())
+        _name = f"{_n}_tool_format_data_{_time_now}.{self.output_format}"
+        return _name, os.path.join(_path, _name)
+
+    #  from raw text to csv, the parsed data is cached by file content, an unchanged file is not parsed again,
+    #  its cached data is saved to a new converted file, which is kept in self.file_path like a parsed one
     def convert_raw_data_to_csv(self) -> bool:
         file_list = self.get_file_paths()
         self.df_data = dict()
         self.file_path = list()
+        _project = self.get_parameter_project()
+        _sensor = self.sensor_type.lower()
+        results = dict()
+        cache_keys = dict()
         for val in file_list:
-            _path = os.path.dirname(val)
-            _n = os.path.basename(val)
-            _time_now = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-            _name = f"{_n}_tool_format_data_{_time_now}.csv"
-            save_path = os.path.join(_path, _name)
+            cache_keys[val] = self.parse_cache.make_key(file_digest(val), _project, _sensor, PARSER_VERSION)
+            _cached = self.parse_cache.get(cache_keys[val])
+            if _cached is not None:
+                _name, save_path = self.get_target_file(val)
+                save_path = save_data_file(_cached, save_path)
+                results[val] = [_name, save_path, _cached]
+                self.logger.info(f"load raw data from cache: {val}, save to {_name}")
+        _files = [val for val in file_list if val not in results]
+        if len(_files) > 1 and self.convert_workers is not None and self.convert_workers > 1:
+            ret = self.convert_raw_data_to_csv_parallel(_files, results)
+        else:
+            ret = self.convert_raw_data_to_csv_serial(_files, results)
+        if not ret:
+            return False
+        # keep the order of file list
+        for val in file_list:
+            if val in results:
+                _name, save_path, df_data = results[val]
+                if val in _files:
+                    self.parse_cache.put(cache_keys[val], df_data)
+                self.df_data.update({_name: df_data})
+                self.file_path.append(save_path)
+        if len(self.file_path):
+            return True
+        else:
+            return False
+
+    # convert raw files one by one, results: {raw file: [name, csv file, data]}
+    def convert_raw_data_to_csv_serial(self, file_list: list, results: dict) -> bool:
+        for val in file_list:
+            _name, save_path = self.get_target_file(val)
             _err, df_data = self.rdp.extract_sensor_data(_source_file=val, _sensor=self.sensor_type.lower(),
                                                          _project=self.get_parameter_project(),
                                                          _target_file=save_path)
@@ -393,16 +475,42 @@ class FlowControl:
                 if _answer:
                     continue
                 else:
-                    self.df_data = dict()
-                    self.file_path = list()
                     return False
-            self.df_data.update({_name: df_data})
-            self.file_path.append(save_path)
+            results[val] = [_name, save_path, df_data]
             self.logger.info(f"save raw data to csv file: {_name}")
-        if len(self.file_path):
-            return True
-        else:
-            return False
+        return True
+
+    # convert raw files in a process pool, they are handled in the order they finish
+    def convert_raw_data_to_csv_parallel(self, file_list: list, results: dict) -> bool:
+        _project = self.get_parameter_project()
+        _sensor = self.sensor_type.lower()
+        _workers = min(self.convert_workers, len(file_list))
+        self.logger.info(f"convert {len(file_list)} files with {_workers} processes")
+        with ProcessPoolExecutor(max_workers=_workers) as executor:
+            futures = dict()
+            for val in file_list:
+                _name, save_path = self.get_target_file(val)
+                _future = executor.submit(extract_sensor_file, _project, val, _sensor, save_path,
+                                          **self.rdp.parser_kwargs())
+                futures[_future] = [val, _name, save_path]
+            for _future in as_completed(futures):
+                val, _name, save_path = futures[_future]
+                try:
+                    _err, df_data = _future.result()
+                except Exception as ex:  # worker process is broken, e.g. out of memory
+                    self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
+                    _err, df_data = ErrorCode.ERR_BAD_UNKNOWN, None
+                if _err != ErrorCode.ERR_NO_ERROR:
+                    _answer = self.messagebox.query("Error", f"Data invalid, {_err}\n{os.path.basename(val)}")
+                    self.logger.error(f"Error during extract data from {val}, {_err}, {_answer}")
+                    if _answer:
+                        continue
+                    else:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        return False
+                results[val] = [_name, save_path, df_data]
+                self.logger.info(f"save raw data to csv file: {_name}")
+        return True
 
     # from csv to csv
     def convert_test_data(self, _project: str, _sensor: str):
@@ -445,14 +553,14 @@ class FlowControl:
                 for file in file_path:
                     _name = os.path.basename(file)
                     try:
-                        data = pd.read_csv(file, index_col=False)
+                        data = load_data_file(file)
                     except Exception as e:
-                        self.logger.error(f"Error during read csv file: {_name}")
+                        self.logger.error(f"Error during read data file: {_name}")
                         self.logger.error(f"{str(e)}\nin {__file__}:{str(e.__traceback__.tb_lineno)}")
                         continue
                     self.file_path.append(file)
                     self.df_data.update({_name: data})
-                    self.logger.debug(f"read csv: {_name}")
+                    self.logger.debug(f"read data file: {_name}")
                 ret = True
         except Exception as ex:
             self.logger.error(f"{str(ex)}\nin {__file__}:{str(ex.__traceback__.tb_lineno)}")
@@ -529,7 +637,8 @@ class FlowControl:
             return
 
         self.get_data_visualize_parameters()
-        self.dv = DataVisualize(params=self.dv_params, logger=self.logger, canvas=self.plotCanvas)
+        self.dv = DataVisualize(params=self.dv_params, logger=self.logger, canvas=self.plotCanvas,
+                                result_cache=self.result_cache, stage_cache=self.stage_cache)
 
         if self.dv_params.selected_columns is not None and len(self.dv_params.selected_columns):
             if len(self.selected_files) > 1:  # for multiple files
@@ -698,6 +807,7 @@ class FlowControl:
         self.logger.debug(f"plot name: {self.dv_params.plot_name}")
         val = self.get_filer_parameters_dict(self.manualSearchPeak)
         self.dv_params.search_peak = float(val["freq"]) if val is not None else 0
+        self.dv_params.psd_segment = self.get_filer_parameters_dict(self.welchSegment, ['nperseg', 'overlap'])
 
         self.dv_params.high_pass_filter = self.get_filer_parameters_dict(self.highPassFilter, ['order', 'freq'])
         self.dv_params.low_pass_filter = self.get_filer_parameters_dict(self.lowPassFilter, ['order', 'freq'])